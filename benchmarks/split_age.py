@@ -0,0 +1,52 @@
+import argparse
+import csv
+import os
+import statistics
+import sys
+import time
+
+code_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "code")
+sys.path.insert(0, code_dir)
+import load_data
+
+
+# ***************** HELPER FUNCTIONS *****************
+def readAgeColumn(csv_filename):
+	'''
+	Function to read the age group column of the drug poisoning CSV file.
+	'''
+	with open(csv_filename, encoding="utf-8") as drug_poisoning:
+		drug_poisoning_reader = csv.reader(drug_poisoning, delimiter=",")
+		next(drug_poisoning_reader)
+		return [row[2] for row in drug_poisoning_reader]
+
+def timeSplitAge(split_age, ages, runs):
+	'''
+	Function to measure the time (in seconds) to split every age in ages,
+	once per run. The cache of splitAge is cleared before every run, so
+	each run includes parsing the distinct values.
+	'''
+	times = []
+	for i in range(runs):
+		load_data.splitAge.cache_clear()
+		start = time.perf_counter()
+		for age in ages:
+			split_age(age)
+		times.append(time.perf_counter() - start)
+	return times
+
+
+# ***************** MAIN PROGRAM *****************
+if __name__ == "__main__":
+	arg_parser = argparse.ArgumentParser(description="Measure load_data.splitAge over the age column of the drug poisoning data.")
+	arg_parser.add_argument("--csv-file", default=os.path.join(code_dir, load_data.drug_poisoning_file),
+		help="drug poisoning CSV file (default: the one in code/datasets)")
+	arg_parser.add_argument("--runs", type=int, default=10, help="number of times to split the whole column")
+	args = arg_parser.parse_args()
+
+	ages = readAgeColumn(args.csv_file)
+	print("{} rows, {} distinct age groups".format(len(ages), len(set(ages))))
+	for name, split_age in (("uncached", load_data.splitAge.__wrapped__), ("cached", load_data.splitAge)):
+		times = timeSplitAge(split_age, ages, args.runs)
+		print("splitAge ({}) over {} runs: median {:.1f} ms ({:.0f} ns per row), min {:.1f} ms".format(
+			name, args.runs, statistics.median(times)*1000, statistics.median(times)/len(ages)*1e9, min(times)*1000))
@@ -0,0 +1,44 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+# ***************** HELPER FUNCTIONS *****************
+def timeToFirstMenu(code_dir):
+	'''
+	Function to start Application.py in code_dir and measure the time
+	(in seconds) until the first menu prompt has been written to stdout.
+	The application is then ended by answering 'E'.
+	'''
+	marker = b"discovery option you would like to run"
+	env = dict(os.environ, PYTHONUNBUFFERED="1")
+	start = time.perf_counter()
+	application = subprocess.Popen([sys.executable, "Application.py"], cwd=code_dir, env=env,
+		stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+	output = b""
+	while marker not in output:
+		chunk = os.read(application.stdout.fileno(), 4096)
+		if not chunk:
+			raise RuntimeError("Application.py ended before the menu was shown:\n" + application.stderr.read().decode())
+		output += chunk
+	elapsed = time.perf_counter() - start
+
+	application.communicate(b"E\n")
+	return elapsed
+
+
+# ***************** MAIN PROGRAM *****************
+if __name__ == "__main__":
+	arg_parser = argparse.ArgumentParser(description="Measure the time from starting Application.py to the first menu render.")
+	arg_parser.add_argument("--code-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "code"),
+		help="folder with Application.py and the XML file (e.g. a checkout of an older revision to compare against)")
+	arg_parser.add_argument("--runs", type=int, default=10, help="number of times to start the application")
+	args = arg_parser.parse_args()
+
+	times = [timeToFirstMenu(args.code_dir) for i in range(args.runs)]
+	print("Time to first menu over {} runs: median {:.1f} ms, min {:.1f} ms, max {:.1f} ms".format(
+		args.runs, statistics.median(times)*1000, min(times)*1000, max(times)*1000))
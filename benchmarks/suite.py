@@ -0,0 +1,307 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+code_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "code")
+sys.path.insert(0, code_dir)
+import psycopg2
+import psycopg2.extras
+import Application
+import Database
+import load_data
+import synthetic_data
+
+# Timings that differ by less than this (in seconds) from the compared run are never marked as slower
+noise_floor = 0.002
+
+# The role and database that load_data.py and Database.py connect as
+database_user = "dbms_project_user"
+database_password = "dbms_password"
+database_name = "dbms_final_project"
+
+
+# ***************** THROWAWAY POSTGRESQL SERVER *****************
+def findPostgresBin(pg_bin):
+	'''
+	Function to find the folder with the PostgreSQL server programs
+	(initdb, pg_ctl): pg_bin if given, else the folder of initdb on the
+	PATH, else the one pg_config reports.
+	'''
+	if pg_bin:
+		return pg_bin
+	initdb = shutil.which("initdb")
+	if initdb:
+		return os.path.dirname(initdb)
+	try:
+		return subprocess.run(["pg_config", "--bindir"], check=True, capture_output=True, text=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		raise SystemExit("Could not find initdb: put the PostgreSQL programs on the PATH or use --pg-bin")
+
+@contextlib.contextmanager
+def throwawayPostgres(pg_bin, port):
+	'''
+	Context manager that creates a new PostgreSQL cluster in a temporary
+	folder and starts it, listening only on a Unix socket in that folder
+	(no network), with the role the application uses. Yields the socket
+	folder. The server is stopped and the folder deleted at the end.
+	'''
+	if hasattr(os, "geteuid") and os.geteuid() == 0:
+		raise SystemExit("PostgreSQL does not run as root: run the benchmarks as another user")
+	temp_dir = tempfile.mkdtemp(prefix="benchmark-postgres-")
+	data_dir = os.path.join(temp_dir, "data")
+	try:
+		subprocess.run([os.path.join(pg_bin, "initdb"), "-D", data_dir, "-U", "postgres", "--auth=trust", "-E", "UTF8", "--no-sync"],
+			check=True, capture_output=True)
+		subprocess.run([os.path.join(pg_bin, "pg_ctl"), "-D", data_dir, "-w", "-l", os.path.join(temp_dir, "server.log"),
+			"-o", "-p {} -k {} -c listen_addresses=''".format(port, temp_dir), "start"], check=True, capture_output=True)
+		try:
+			admin_conn = psycopg2.connect(host=temp_dir, port=port, user="postgres", dbname="postgres")
+			admin_conn.autocommit = True
+			admin_conn.cursor().execute("CREATE ROLE {} LOGIN PASSWORD %s".format(database_user), (database_password,))
+			admin_conn.close()
+			yield temp_dir
+		finally:
+			subprocess.run([os.path.join(pg_bin, "pg_ctl"), "-D", data_dir, "-m", "fast", "stop"], capture_output=True)
+	finally:
+		shutil.rmtree(temp_dir, ignore_errors=True)
+
+def createDatabase(socket_dir, port):
+	'''
+	Function to (re)create an empty application database, and to point
+	load_data.py and Database.py at it. Returns its connection string.
+	'''
+	admin_conn = psycopg2.connect(host=socket_dir, port=port, user="postgres", dbname="postgres")
+	admin_conn.autocommit = True
+	admin_cursor = admin_conn.cursor()
+	admin_cursor.execute("DROP DATABASE IF EXISTS {}".format(database_name))
+	admin_cursor.execute("CREATE DATABASE {} OWNER {}".format(database_name, database_user))
+	admin_conn.close()
+
+	connection_string = "host='{}' port={} dbname='{}' user='{}' password='{}'".format(
+		socket_dir, port, database_name, database_user, database_password)
+	load_data.connection_string = connection_string
+	Database.connection_string = connection_string
+
+	# Drop everything Database.py kept from the last database
+	Database.closePool()
+	Database.clearCache()
+	Database.validation_catalog = None
+	Database.drug_poisoning_data = None
+	return connection_string
+
+
+# ***************** HELPER FUNCTIONS *****************
+def timeCall(function, *args):
+	'''
+	Function to call function once. Returns (seconds taken, result).
+	'''
+	start = time.perf_counter()
+	result = function(*args)
+	return time.perf_counter() - start, result
+
+def timeRuns(function, runs, before_run=None):
+	'''
+	Function to call function runs times (calling before_run before each
+	run, outside of the timing). Returns the median and minimum seconds,
+	and the number of rows in the (last) result.
+	'''
+	times = []
+	result = None
+	for i in range(runs):
+		if before_run is not None:
+			before_run()
+		seconds, result = timeCall(function)
+		times.append(seconds)
+	rows = len(result) if hasattr(result, '__len__') else None
+	return {'median': statistics.median(times), 'min': min(times), 'rows': rows}
+
+def loadStages(connection_string, loader):
+	'''
+	Function to run the stages of load_data.py on the datasets in the
+	current folder, one at a time, and to time each of them. loader is
+	"row" or "bulk" (as the load_data.py options), or "columnar" (bulk,
+	with the drug poisoning file read with --columnar).
+	'''
+	timings = dict()
+	load_data.columnar = (loader == "columnar")
+	conn = psycopg2.connect(connection_string)
+	cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+
+	def stage(name, function):
+		timings[name], result = timeCall(function)
+		conn.commit()
+		print("\tload: {:<36} {:8.3f} s".format(name, timings[name]))
+
+	stage("schema", lambda: cursor.execute(open("schema.sql", "r").read()))
+	dimension_cache = load_data.DimensionCache(cursor)
+	for dataset in load_data.datasets[:3]:
+		stage(dataset, lambda: load_data.loadDataset(cursor, dataset, False, loader != "row", dimension_cache))
+	stage("summary views", lambda: load_data.refreshSummaryViews(cursor))
+	stage("indexes and statistics", lambda: load_data.createIndexes(cursor))
+	load_data.bumpDataVersion(cursor)
+	conn.commit()
+	load_data.clearCheckpoints(cursor)
+	stage("Drug Poisoning (XML and snapshot)", lambda: load_data.loadDataset(cursor, "Drug Poisoning", False))
+	conn.close()
+	return timings
+
+def queryParameters():
+	'''
+	Function to pick parameters for each query that return rows from
+	the loaded data.
+	'''
+	with Database.getCursor() as cursor:
+		cursor.execute("SELECT yearstart, yearend, locationdesc, questionid FROM ChronicDiseaseIndicator NATURAL JOIN Location ORDER BY yearstart, locationid LIMIT 1")
+		query_four = tuple(cursor.fetchone())
+		cursor.execute("SELECT yearstart, locationdesc, questionid FROM Nutrition NATURAL JOIN Location ORDER BY yearstart, locationid LIMIT 1")
+		query_five = tuple(cursor.fetchone())
+	lcd_years = Database.getYearRangeForLeadingCauseOfDeath()
+	nutrition_years = Database.getYearRangeForNutrition()
+	common_year = min(lcd_years[1], nutrition_years[1])
+	drug_poisoning_years = Database.getDrugPoisoningYears()
+	return {
+		'queryOne': (lcd_years[1],),
+		'queryOneAllYears': (),
+		'queryTwo': (nutrition_years[1],),
+		'queryThree': (common_year,),
+		'queryFour': query_four,
+		'queryFive': query_five,
+		'querySix': (common_year,),
+		'querySeven': (drug_poisoning_years[0], "United States"),
+		'queryDrugPoisoning': (drug_poisoning_years[0], drug_poisoning_years[1], None, ["Both Sexes"], None, None, ("year", "state"))
+	}
+
+def queryTimings(runs):
+	'''
+	Function to time each Database.queryN (with the result cache emptied
+	before every run, so each run goes to the database), and the
+	validation catalog.
+	'''
+	timings = dict()
+	def reset():
+		Database.clearCache()
+		Database.validation_catalog = None
+	timings['drug poisoning data (first use)'], data = timeCall(Database.getDrugPoisoningData)
+	timings['validation catalog'] = timeRuns(Database.getValidationCatalog, runs, reset)
+
+	for name, parameters in queryParameters().items():
+		query_function = getattr(Database, name)
+		timings[name] = timeRuns(lambda: query_function(*parameters), runs, Database.clearCache)
+		print("\tquery: {:<35} {:8.3f} s ({} rows)".format(name, timings[name]['median'], timings[name]['rows']))
+	return timings
+
+def renderTimings(runs, rows):
+	'''
+	Function to time prettyPrintResults and streamPrintResults on the
+	rows of queryOneAllYears and on a table of rows synthetic rows,
+	written to memory.
+	'''
+	timings = dict()
+	headings = Application.query_headings[1]
+	all_years = Database.queryOneAllYears()
+	synthetic_rows = [[1999 + i % 20, "State {}".format(i % 1000), "Heart disease", i] for i in range(rows)]
+	for name, function in (
+		("prettyPrintResults (queryOneAllYears)", lambda: Application.prettyPrintResults(all_years, headings, io.StringIO())),
+		("prettyPrintResults ({} rows)".format(rows), lambda: Application.prettyPrintResults(synthetic_rows, headings, io.StringIO())),
+		("streamPrintResults ({} rows)".format(rows), lambda: Application.streamPrintResults(iter(synthetic_rows), headings, out=io.StringIO())),
+		("streamPrintResults (streamQueryOneAllYears)", lambda: Application.streamPrintResults(Database.streamQueryOneAllYears(), headings, out=io.StringIO()))
+	):
+		timings[name] = timeRuns(function, runs)
+		print("\trender: {:<34} {:8.3f} s".format(name, timings[name]['median']))
+	return timings
+
+def flattenTimings(results):
+	'''
+	Function to list every timing of a results file as
+	"scale / section / name": seconds (the median for repeated runs).
+	'''
+	flat = dict()
+	for scale, sections in results['scales'].items():
+		for section, timings in sections.items():
+			for name, timing in timings.items():
+				flat["{} / {} / {}".format(scale, section, name)] = timing['median'] if isinstance(timing, dict) else timing
+	return flat
+
+def compareResults(old_results, new_results, threshold):
+	'''
+	Function to print each timing next to the same timing in an older
+	results file, marking the ones more than threshold (a fraction)
+	and noise_floor seconds slower.
+	'''
+	old_timings = flattenTimings(old_results)
+	print("\nCompared with the results from {}:".format(old_results.get('created', 'an older run')))
+	for name, seconds in flattenTimings(new_results).items():
+		if name not in old_timings or old_timings[name] <= 0:
+			continue
+		ratio = seconds / old_timings[name]
+		print("\t{:<70} {:8.3f} s -> {:8.3f} s ({:+.0f}%){}".format(name, old_timings[name], seconds, (ratio - 1)*100,
+			"  SLOWER" if ratio > 1 + threshold and seconds - old_timings[name] > noise_floor else ""))
+
+
+# ***************** MAIN PROGRAM *****************
+if __name__ == "__main__":
+	arg_parser = argparse.ArgumentParser(description="Time the loader stages, the queries and the result rendering on synthetic data, against a throwaway local PostgreSQL server.")
+	arg_parser.add_argument("--scales", default="10000,100000",
+		help="comma separated number of rows in each CSV file, one run per scale (e.g. 10000,100000,1000000; default: %(default)s)")
+	arg_parser.add_argument("--loader", choices=("row", "bulk", "columnar"), default="bulk", help="load_data.py loader to use (default: %(default)s)")
+	arg_parser.add_argument("--runs", type=int, default=5, help="number of times each query and render is timed (default: %(default)s)")
+	arg_parser.add_argument("--output", default="benchmark_results.json", help="JSON file to write the results to (default: %(default)s)")
+	arg_parser.add_argument("--compare", metavar="RESULTS_FILE", help="results file of an earlier run to compare against")
+	arg_parser.add_argument("--threshold", type=float, default=0.2,
+		help="fraction by which a timing has to be slower than in --compare to be marked (default: %(default)s)")
+	arg_parser.add_argument("--pg-bin", help="folder with initdb and pg_ctl (default: from the PATH or pg_config)")
+	arg_parser.add_argument("--port", type=int, default=54329, help="port number of the throwaway server's socket (default: %(default)s)")
+	args = arg_parser.parse_args()
+
+	pg_bin = findPostgresBin(args.pg_bin)
+	results = {
+		'created': datetime.datetime.now().isoformat(timespec='seconds'),
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'loader': args.loader,
+		'runs': args.runs,
+		'scales': dict()
+	}
+	output_filename = os.path.abspath(args.output)
+	original_dir = os.getcwd()
+
+	with throwawayPostgres(pg_bin, args.port) as socket_dir:
+		for scale in [int(scale) for scale in args.scales.split(',')]:
+			work_dir = tempfile.mkdtemp(prefix="benchmark-data-")
+			try:
+				print("{} rows per file:".format(scale))
+				synthetic_data.writeDatasets(work_dir, scale)
+				for filename in ("schema.sql", "indexes.sql"):
+					shutil.copy(os.path.join(code_dir, filename), work_dir)
+				# load_data.py and Database.py use paths relative to the current folder
+				os.chdir(work_dir)
+				connection_string = createDatabase(socket_dir, args.port)
+				with contextlib.closing(psycopg2.connect(connection_string)) as conn:
+					results['postgres'] = conn.server_version
+				results['scales'][str(scale)] = {
+					'load': loadStages(connection_string, args.loader),
+					'queries': queryTimings(args.runs),
+					'render': renderTimings(args.runs, scale)
+				}
+			finally:
+				Database.closePool()
+				os.chdir(original_dir)
+				shutil.rmtree(work_dir, ignore_errors=True)
+
+	with open(output_filename, "w") as output_file:
+		json.dump(results, output_file, indent=4)
+	print("Results written to", output_filename)
+
+	if args.compare:
+		with open(args.compare) as compare_file:
+			compareResults(json.load(compare_file), results, args.threshold)
@@ -0,0 +1,186 @@
+import argparse
+import csv
+import itertools
+import os
+import random
+import string
+import sys
+
+code_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "code")
+sys.path.insert(0, code_dir)
+import load_data
+
+# Synthetic versions of the four CSV files, with the columns (and the kinds of
+# values) that load_data.py expects. Every dataset gets the requested number of
+# rows: the years, questions, stratifications and so on are fixed, and there are
+# as many locations as needed, so that the keys of the rows are distinct. The
+# same locations are used in every file so that the queries that join the
+# datasets return rows.
+
+leading_causes_of_death_header = ["Year", "113 Cause Name", "Cause Name", "State", "Deaths", "Age-adjusted Death Rate"]
+
+nutrition_header = ["YearStart", "YearEnd", "LocationAbbr", "LocationDesc", "Datasource", "Class", "Topic", "Question",
+	"Data_Value_Unit", "Data_Value_Type", "Data_Value", "Data_Value_Alt", "Data_Value_Footnote_Symbol", "Data_Value_Footnote",
+	"Low_Confidence_Limit", "High_Confidence_Limit ", "Sample_Size", "Total", "Age(years)", "Education", "Gender", "Income",
+	"Race/Ethnicity", "GeoLocation", "ClassID", "TopicID", "QuestionID", "DataValueTypeID", "LocationID",
+	"StratificationCategory1", "Stratification1", "StratificationCategoryId1", "StratificationID1"]
+
+chronic_disease_indicators_header = ["YearStart", "YearEnd", "LocationAbbr", "LocationDesc", "DataSource", "Topic", "Question",
+	"Response", "DataValueUnit", "DataValueType", "DataValue", "DataValueAlt", "DataValueFootnoteSymbol", "DatavalueFootnote",
+	"LowConfidenceLimit", "HighConfidenceLimit", "StratificationCategory1", "Stratification1", "StratificationCategory2",
+	"Stratification2", "StratificationCategory3", "Stratification3", "GeoLocation", "ResponseID", "LocationID", "TopicID",
+	"QuestionID", "DataValueTypeID", "StratificationCategoryID1", "StratificationID1", "StratificationCategoryID2",
+	"StratificationID2", "StratificationCategoryID3", "StratificationID3"]
+
+drug_poisoning_header = ["Year", "Sex", "Age Group", "Race and Hispanic Origin", "State", "Deaths", "Population",
+	"Crude Death Rate", "Standard Error for Crude Rate", "Lower Confidence Limit for Crude Rate",
+	"Upper Confidence Limit for Crude Rate", "Age-adjusted Rate", "Standard Error for Age-adjusted Rate",
+	"Lower Confidence Limit for Age-adjusted Rate", "Upper Confidence Limit for Age-adjusted Rate",
+	"State Crude Rate in Range", "US Crude Rate", "US Age-adjusted Rate", "Unit"]
+
+causes = [("All causes", "All causes"), ("Heart disease", "Diseases of heart (I00-I09)"),
+	("Cancer", "Malignant neoplasms (C00-C97)"), ("Stroke", "Cerebrovascular diseases (I60-I69)"),
+	("Unintentional injuries", "Accidents (unintentional injuries) (V01-X59,Y85-Y86)"),
+	("CLRD", "Chronic lower respiratory diseases (J40-J47)"), ("Diabetes", "Diabetes mellitus (E10-E14)"),
+	("Alzheimer's disease", "Alzheimer's disease (G30)"), ("Influenza and pneumonia", "Influenza and pneumonia (J09-J18)"),
+	("Kidney disease", "Nephritis, nephrotic syndrome and nephrosis (N00-N07,N17-N19,N25-N27)")]
+
+# (QuestionID, Question, TopicID, Topic, ClassID, Class). Queries 2, 3 and 6 use Q036, Q037 and Q047.
+nutrition_questions = [
+	("Q036", "Percent of adults aged 18 years and older who have obesity", "OWS", "Obesity / Weight Status", "OWS", "Obesity / Weight Status"),
+	("Q037", "Percent of adults aged 18 years and older who have an overweight classification", "OWS", "Obesity / Weight Status", "OWS", "Obesity / Weight Status"),
+	("Q047", "Percent of adults who engage in no leisure-time physical activity", "PA1", "Physical Activity - Behavior", "PA", "Physical Activity")]
+
+# (QuestionID, Question, TopicID, Topic)
+chronic_disease_indicators_questions = [
+	("ALC1_1", "Alcohol use among youth", "ALC", "Alcohol"),
+	("CVD1_1", "Mortality from heart failure", "CVD", "Cardiovascular Disease"),
+	("DIA1_1", "Prevalence of diagnosed diabetes among adults aged >= 18 years", "DIA", "Diabetes")]
+
+# (StratificationCategory1, Stratification1, StratificationCategoryId1, StratificationID1)
+stratifications = [("Total", "Total", "OVR", "OVERALL"), ("Gender", "Male", "GEN", "MALE"),
+	("Gender", "Female", "GEN", "FEMALE"), ("Age (years)", "18 - 24", "AGEYR", "AGEYR1824")]
+
+sexes = ["Both Sexes", "Male", "Female"]
+age_groups = ["All Ages", "Less than 15 years", "15-24 years", "25-34 years", "35-44 years", "45-54 years",
+	"55-64 years", "65-74 years", "75+ years"]
+races = ["All Races-All Origins", "Hispanic", "Non-Hispanic Black", "Non-Hispanic White"]
+
+
+# ***************** HELPER FUNCTIONS *****************
+def locations(count):
+	'''
+	Function to list count locations as (LocationID, abbreviation,
+	name): a few real states, and then numbered ones.
+	'''
+	states = ["Alabama", "Alaska", "Arizona", "California", "New York", "Texas"]
+	letter_pairs = ["".join(pair) for pair in itertools.product(string.ascii_uppercase, repeat=2)]
+	names = states[:count] + ["State {}".format(i) for i in range(len(states), count)]
+	return [(i + 1, letter_pairs[i % len(letter_pairs)], name) for i, name in enumerate(names)]
+
+def locationsFor(rows, rows_per_location):
+	'''
+	Function to list enough locations for rows rows, when each location
+	has rows_per_location of them.
+	'''
+	return locations(max(1, -(-rows // rows_per_location)))
+
+def writeRows(csv_filename, header, rows):
+	'''
+	Function to write the header and rows to a CSV file.
+	'''
+	with open(csv_filename, "w", newline="", encoding="utf-8") as csv_file:
+		csv_writer = csv.writer(csv_file)
+		csv_writer.writerow(header)
+		csv_writer.writerows(rows)
+
+def leadingCausesOfDeathRows(rows, rnd):
+	'''
+	Generator for the rows of the leading causes of death file.
+	'''
+	years = range(1999, 2018)
+	keys = itertools.product(locationsFor(rows, len(years)*len(causes)), years, causes)
+	for (location_id, abbreviation, state), year, (cause, expanded_cause) in itertools.islice(keys, rows):
+		yield [year, expanded_cause, cause, state, rnd.randint(100, 90000), round(rnd.uniform(10, 900), 1)]
+
+def nutritionRows(rows, rnd):
+	'''
+	Generator for the rows of the nutrition file. About 5% of the values
+	are missing, as in the real file.
+	'''
+	years = range(2011, 2020)
+	keys = itertools.product(locationsFor(rows, len(years)*len(nutrition_questions)*len(stratifications)), years,
+		nutrition_questions, stratifications)
+	for location, year, question, stratification in itertools.islice(keys, rows):
+		location_id, abbreviation, state = location
+		question_id, question_text, topic_id, topic, class_id, class_name = question
+		value = "" if rnd.random() < 0.05 else round(rnd.uniform(15, 45), 1)
+		yield [year, year, abbreviation, state, "Behavioral Risk Factor Surveillance System", class_name, topic,
+			question_text, "", "Value", value, value, "", "",
+			"" if value == "" else round(value - 3, 1), "" if value == "" else round(value + 3, 1),
+			"" if value == "" else rnd.randint(50, 9000), "", "", "", "", "", "", "(32.8, -86.6)",
+			class_id, topic_id, question_id, "VALUE", location_id] + list(stratification)
+
+def chronicDiseaseIndicatorsRows(rows, rnd):
+	'''
+	Generator for the rows of the chronic disease indicators file.
+	'''
+	years = range(2001, 2021)
+	keys = itertools.product(locationsFor(rows, len(years)*len(chronic_disease_indicators_questions)*len(stratifications)), years,
+		chronic_disease_indicators_questions, stratifications)
+	for location, year, question, stratification in itertools.islice(keys, rows):
+		location_id, abbreviation, state = location
+		question_id, question_text, topic_id, topic = question
+		category, stratification_name, category_id, stratification_id = stratification
+		value_type_id = rnd.choice(("CRDPREV", "AGEADJPREV"))
+		value = "" if rnd.random() < 0.05 else round(rnd.uniform(1, 60), 1)
+		yield [year, year + rnd.randint(0, 1), abbreviation, state, "BRFSS", topic, question_text, "", "%",
+			value_type_id.title(), value, value, "", "", "", "", category, stratification_name, "", "", "", "", "", "",
+			location_id, topic_id, question_id, value_type_id, category_id, stratification_id, "", "", "", ""]
+
+def drugPoisoningRows(rows, rnd):
+	'''
+	Generator for the rows of the drug poisoning file, for the United
+	States and the states.
+	'''
+	years = range(1999, 2018)
+	states = ["United States"] + [state for location_id, abbreviation, state in
+		locationsFor(rows, len(years)*len(sexes)*len(age_groups)*len(races))]
+	keys = itertools.product(states, years, sexes, age_groups, races)
+	for state, year, sex, age_group, race in itertools.islice(keys, rows):
+		deaths = rnd.randint(0, 5000)
+		population = rnd.randint(10000, 9000000)
+		blank = rnd.random() < 0.2
+		yield [year, sex, age_group, race, state, deaths, population, round(deaths*1e5/population, 1),
+			"" if blank else 0.1, "" if blank else 1.0, "" if blank else 2.0, "" if blank else 1.5, "", "", "",
+			"" if blank else "9.4–11.9", 6.1, 6.2, "per 100,000 population"]
+
+def writeDatasets(output_dir, rows, seed=1):
+	'''
+	Function to write the four synthetic CSV files, with rows rows each,
+	to output_dir under the file names that load_data.py reads (in a
+	datasets folder). Returns the datasets folder.
+	'''
+	rnd = random.Random(seed)
+	datasets_dir = os.path.join(output_dir, "datasets")
+	os.makedirs(datasets_dir, exist_ok=True)
+	for csv_filename, header, generator in (
+		(load_data.leading_causes_of_death_file, leading_causes_of_death_header, leadingCausesOfDeathRows),
+		(load_data.nutrition_file, nutrition_header, nutritionRows),
+		(load_data.chronic_disease_indicators_file, chronic_disease_indicators_header, chronicDiseaseIndicatorsRows),
+		(load_data.drug_poisoning_file, drug_poisoning_header, drugPoisoningRows)
+	):
+		writeRows(os.path.join(output_dir, csv_filename), header, generator(rows, rnd))
+	return datasets_dir
+
+
+# ***************** MAIN PROGRAM *****************
+if __name__ == "__main__":
+	arg_parser = argparse.ArgumentParser(description="Write synthetic versions of the four CSV files that load_data.py reads.")
+	arg_parser.add_argument("--rows", type=int, default=10000, help="number of rows in each file (default: %(default)s)")
+	arg_parser.add_argument("--output-dir", default=".",
+		help="folder to write the datasets folder into (default: the current folder)")
+	arg_parser.add_argument("--seed", type=int, default=1, help="seed of the random values (default: %(default)s)")
+	args = arg_parser.parse_args()
+
+	print("Wrote the datasets to", writeDatasets(args.output_dir, args.rows, args.seed))
@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+code_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "code")
+sys.path.insert(0, code_dir)
+import Database
+
+root_end_tag = b"</DrugPoisoning>"
+first_statistic_tag = b"<DrugPoisoningStatistic>"
+
+
+# ***************** HELPER FUNCTIONS *****************
+def peakMemoryMB():
+	'''
+	Function to get the peak resident memory of this process, in MB.
+	'''
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def writeScaledXML(xml_filename, scale, scaled_filename):
+	'''
+	Function to write a copy of the XML file with its statistics
+	repeated scale times, to see how memory use grows with file size.
+	'''
+	with open(xml_filename, 'rb') as xml_file:
+		head = xml_file.read(1 << 16)
+		body_start = head.index(first_statistic_tag)
+		xml_file.seek(0, os.SEEK_END)
+		file_size = xml_file.tell()
+		xml_file.seek(max(0, file_size - (1 << 16)))
+		tail = xml_file.read()
+		body_end = file_size - len(tail) + tail.rindex(root_end_tag)
+
+		with open(scaled_filename, 'wb') as scaled_file:
+			scaled_file.write(head[:body_start])
+			for i in range(scale):
+				xml_file.seek(body_start)
+				remaining = body_end - body_start
+				while remaining > 0:
+					block = xml_file.read(min(remaining, 1 << 20))
+					scaled_file.write(block)
+					remaining -= len(block)
+			scaled_file.write(root_end_tag + b"\n")
+
+def measureMode(mode, xml_filename, year, state):
+	'''
+	Function to answer the three drug poisoning functions from the XML
+	file, either from the in-memory data ("tree": the whole file parsed
+	once) or with a pass of iterparse per call ("stream"). Returns the
+	seconds taken by the load and by each call, and the memory used.
+	'''
+	Database.xml_file = xml_filename
+	Database.snapshot_file = os.devnull
+	Database.drug_poisoning_settings['low_memory'] = (mode == "stream")
+	baseline = peakMemoryMB()
+	times = dict()
+
+	start = time.perf_counter()
+	if mode == "tree":
+		Database.getDrugPoisoningData()
+	times['load'] = time.perf_counter() - start
+
+	calls = (
+		('years', lambda: Database.getDrugPoisoningYears()),
+		('states', lambda: Database.getDrugPoisoningStates()),
+		('query_seven', lambda: Database.querySeven.__wrapped__(year, state))
+	)
+	rows = None
+	for name, call in calls:
+		start = time.perf_counter()
+		rows = call()
+		times[name] = time.perf_counter() - start
+
+	return {'mode': mode, 'times': times, 'query_seven_rows': len(rows), 'memory_mb': peakMemoryMB() - baseline}
+
+
+# ***************** MAIN PROGRAM *****************
+if __name__ == "__main__":
+	arg_parser = argparse.ArgumentParser(description="Compare the in-memory and the streamed (low memory) XML modes of the drug poisoning functions.")
+	arg_parser.add_argument("--xml-file", default=os.path.join(code_dir, Database.xml_file),
+		help="drug poisoning XML file (default: the one in code)")
+	arg_parser.add_argument("--scales", default="1,2",
+		help="comma separated number of copies of the data to measure with (default: %(default)s)")
+	arg_parser.add_argument("--year", type=int, default=2010, help="year for querySeven")
+	arg_parser.add_argument("--state", default="United States", help="state for querySeven")
+	arg_parser.add_argument("--mode", choices=("tree", "stream"), help=argparse.SUPPRESS)
+	args = arg_parser.parse_args()
+
+	# Each measurement runs in its own process, so its peak memory is its own
+	if args.mode:
+		print(json.dumps(measureMode(args.mode, args.xml_file, args.year, args.state)))
+		raise SystemExit(0)
+
+	temp_dir = tempfile.mkdtemp()
+	try:
+		for scale in [int(scale) for scale in args.scales.split(',')]:
+			xml_filename = args.xml_file
+			if scale != 1:
+				xml_filename = os.path.join(temp_dir, "scaled.xml")
+				writeScaledXML(args.xml_file, scale, xml_filename)
+			size_mb = os.path.getsize(xml_filename) / (1 << 20)
+
+			for mode in ("tree", "stream"):
+				output = subprocess.run([sys.executable, os.path.abspath(__file__), "--mode", mode, "--xml-file", xml_filename,
+					"--year", str(args.year), "--state", args.state], check=True, capture_output=True, text=True).stdout
+				result = json.loads(output)
+				times = result['times']
+				passes = times['load'] + times['years'] + times['states'] + times['query_seven']
+				print("{:.0f} MB XML, {:6}: load {:6.2f} s, years {:6.3f} s, states {:6.3f} s, querySeven {:6.3f} s ({} rows), {:5.1f} MB/s, {:6.1f} MB of memory".format(
+					size_mb, mode, times['load'], times['years'], times['states'], times['query_seven'], result['query_seven_rows'],
+					size_mb * (1 if mode == "tree" else 3) / passes, result['memory_mb']))
+	finally:
+		shutil.rmtree(temp_dir)
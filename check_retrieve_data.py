@@ -0,0 +1,126 @@
+import functools
+import hashlib
+import http.server
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+
+# Offline check of retrieve_data.py: serves two files (and a missing one) from a
+# local http.server, runs retrieve_data.py against it a few times and checks the
+# outcome of every file, the exit code and the manifest.
+retrieve_data_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieve_data.py")
+
+
+# ***** HELPER FUNCTIONS *****
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    '''
+    Serves the files of a folder (answering If-Modified-Since with 304,
+    like a real server), without logging every request.
+    '''
+    def log_message(self, format, *args):
+        pass
+
+def writeServedFile(serve_dir, filename, text, mtime):
+    '''
+    Function to write a file to the served folder, with the given
+    modification time (which the server sends as Last-Modified).
+    '''
+    path = os.path.join(serve_dir, filename)
+    with open(path, 'w') as served_file:
+        served_file.write(text)
+    os.utime(path, (mtime, mtime))
+
+def runRetrieveData(datasets_filename, output_dir):
+    '''
+    Function to run retrieve_data.py. Returns its exit code and a
+    dictionary of filename (or url, for a failure): outcome.
+    '''
+    result = subprocess.run([sys.executable, retrieve_data_file, "--datasets-file", datasets_filename,
+        "--output-dir", output_dir], capture_output=True, text=True)
+    outcomes = dict()
+    for line in result.stdout.splitlines():
+        if line.startswith("Could not download"):
+            outcomes[line.split()[3]] = "failed"
+        else:
+            filename, outcome = line.split(' ', 1)
+            outcomes[filename] = outcome
+    return result.returncode, outcomes
+
+def check(condition, message):
+    '''
+    Function to stop with a message if a check fails.
+    '''
+    if not condition:
+        raise SystemExit("FAILED: " + message)
+    print("ok:", message)
+
+
+# ***** MAIN PROGRAM *****
+if __name__ == "__main__":
+    umask = os.umask(0)
+    os.umask(umask)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        serve_dir = os.path.join(temp_dir, "served")
+        output_dir = os.path.join(temp_dir, "datasets")
+        os.makedirs(serve_dir)
+        writeServedFile(serve_dir, "first.csv", "a,b\n1,2\n", 1500000000)
+        writeServedFile(serve_dir, "second.csv", "c,d\n3,4\n", 1500000000)
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=serve_dir))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = "http://127.0.0.1:{}/".format(server.server_address[1])
+        missing_url = base_url + "missing.csv"
+
+        datasets_filename = os.path.join(temp_dir, "datasets.txt")
+        with open(datasets_filename, 'w') as datasets_file:
+            datasets_file.write("\n".join(base_url + filename for filename in ("first.csv", "second.csv", "missing.csv")) + "\n")
+
+        try:
+            # First run: both files are downloaded, the missing one fails
+            returncode, outcomes = runRetrieveData(datasets_filename, output_dir)
+            check(outcomes.get("first.csv") == "downloaded" and outcomes.get("second.csv") == "downloaded",
+                "the files are downloaded")
+            check(outcomes.get(missing_url) == "failed" and returncode == 1, "a 404 is reported and the exit code is 1")
+            with open(os.path.join(output_dir, "manifest.json")) as manifest_file:
+                manifest = json.load(manifest_file)
+            check(manifest[base_url + "first.csv"]['sha256'] == hashlib.sha256(b"a,b\n1,2\n").hexdigest()
+                and missing_url not in manifest, "the manifest records the downloaded files only")
+            check(oct(os.stat(os.path.join(output_dir, "first.csv")).st_mode & 0o777) == oct(0o666 & ~umask),
+                "the files get the permissions the umask allows")
+
+            # Second run: nothing changed on the server, so it answers the conditional requests with 304
+            returncode, outcomes = runRetrieveData(datasets_filename, output_dir)
+            check(outcomes.get("first.csv") == "not modified" and outcomes.get("second.csv") == "not modified",
+                "unchanged files are not sent again (304)")
+
+            # Third run: the first file has new contents, the second is newer but the same
+            writeServedFile(serve_dir, "first.csv", "a,b\n5,6\n", 1600000000)
+            writeServedFile(serve_dir, "second.csv", "c,d\n3,4\n", 1600000000)
+            second_mtime = os.stat(os.path.join(output_dir, "second.csv")).st_mtime_ns
+            returncode, outcomes = runRetrieveData(datasets_filename, output_dir)
+            check(outcomes.get("first.csv") == "downloaded", "a changed file is downloaded again")
+            with open(os.path.join(output_dir, "first.csv")) as first_file:
+                check(first_file.read() == "a,b\n5,6\n", "the changed file replaces the old one")
+            check(outcomes.get("second.csv") == "unchanged"
+                and os.stat(os.path.join(output_dir, "second.csv")).st_mtime_ns == second_mtime,
+                "a file with the same contents is left untouched")
+            with open(os.path.join(output_dir, "manifest.json")) as manifest_file:
+                manifest = json.load(manifest_file)
+            check(manifest[base_url + "first.csv"]['sha256'] == hashlib.sha256(b"a,b\n5,6\n").hexdigest(),
+                "the manifest is rewritten with the new hash")
+            check(not [filename for filename in os.listdir(output_dir) if filename.endswith('.part')],
+                "no temporary files are left behind")
+
+            # Last run: without the missing file, the exit code is 0
+            with open(datasets_filename, 'w') as datasets_file:
+                datasets_file.write(base_url + "first.csv\n" + base_url + "second.csv\n")
+            returncode, outcomes = runRetrieveData(datasets_filename, output_dir)
+            check(returncode == 0, "the exit code is 0 when every file is retrieved")
+        finally:
+            server.shutdown()
+
+    print("All checks passed")
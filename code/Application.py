@@ -1,39 +1,76 @@
+import itertools
+import sys
 import Database
 
 # ****** HELPER FUNCTIONS ******
 
-def prettyPrintResults(results, headings): 
+def formatTableRow(cells, column_widths): 
+	'''
+		Function to format one line of a results table: each cell (a string) 
+		left aligned in its column and preceded by a tab.
+	'''
+	return "".join("\t" + cell.ljust(width) for cell, width in zip(cells, column_widths))
+
+def writeTable(headings, column_widths, formatted_rows, out): 
+	'''
+		Function to write a results table to out: the headings, a line under 
+		them, and then each row of (already formatted) cells, writing every 
+		line with a single call.
+	'''
+	header = formatTableRow(headings, column_widths)
+	out.write("\n" + header + "\n")
+	out.write("\t" + "-"*(len(header) + (len(headings)-1)*4) + "\n")
+	for cells in formatted_rows: 
+		out.write(formatTableRow(cells, column_widths) + "\n")
+
+def prettyPrintResults(results, headings, out=None): 
 	'''
 		Function to print the results of a query in a readable format.
 		Inputs: results - list of rows (lists), headings - list of strings
+		Every cell is converted to a string only once, and the column widths 
+		are the widths of the longest cells. 
+		Use streamPrintResults for results that should not be held in memory.
 	'''
+	out = out or sys.stdout
+
 	# Check if there is data 
 	if len(results) == 0: 
-		print("\tSorry, there is no data available for those parameters.")
+		out.write("\tSorry, there is no data available for those parameters.\n")
 		return 
 
 	#Get the max length for each column
-	max_length_for_columns = []
-	for heading in headings: 
-		max_length_for_columns.append(len(heading))
-	for result in results: 
-		for i in range(len(result)): 
-			if len(str(result[i])) > max_length_for_columns[i]: 
-				max_length_for_columns[i] = len(str(result[i]))
-
-	#Print the headings
-	print()
-	header = ""
-	for i in range(len(headings)): 
-		header += "\t{1:<{0}}".format(max_length_for_columns[i], headings[i])
-	print(header)
-	print("\t", "-"*(len(header) + (len(headings)-1)*4), sep="")
-
-	#print the results
-	for result in results:
-		for i in range(len(result)): 
-			print("\t{1:<{0}}".format(max_length_for_columns[i], str(result[i])), end="", sep="")
-		print()
+	formatted_rows = [[str(value) for value in result] for result in results]
+	column_widths = [len(heading) for heading in headings]
+	for cells in formatted_rows: 
+		column_widths = [max(width, len(cell)) for width, cell in zip(column_widths, cells)]
+
+	writeTable(headings, column_widths, formatted_rows, out)
+
+def streamPrintResults(results, headings, column_widths=None, sample_size=100, out=None): 
+	'''
+		Function to print the results of a query as they are read from 
+		any iterable of rows (e.g. a Database.streamQuery generator), 
+		without holding them all in memory. 
+		The column widths are either fixed (column_widths), or the widths of 
+		the longest cells in the first sample_size rows. A longer cell later 
+		on is printed in full, and pushes the rest of its line to the right.
+	'''
+	out = out or sys.stdout
+	formatted_rows = ([str(value) for value in result] for result in results)
+
+	sample = list(itertools.islice(formatted_rows, sample_size if column_widths is None else 1))
+	if len(sample) == 0: 
+		out.write("\tSorry, there is no data available for those parameters.\n")
+		return 
+
+	if column_widths is None: 
+		column_widths = [len(heading) for heading in headings]
+		for cells in sample: 
+			column_widths = [max(width, len(cell)) for width, cell in zip(column_widths, cells)]
+	else: 
+		column_widths = [max(width, len(heading)) for width, heading in zip(column_widths, headings)]
+
+	writeTable(headings, column_widths, itertools.chain(sample, formatted_rows), out)
 
 def printQueryOptions(): 
 	'''
@@ -64,16 +101,16 @@ def getYearFromUser(year_range):
 			year_input_invalid = False
 	return user_year_input
 
-def getStateFromUser(list_of_states): 
+def getStateFromUser(set_of_states): 
 	'''
 		Funtion to get a valid state through user input. 
-		Input: list of states 
+		Input: set of states 
 		Output: state chosen by user
 	'''
 	state_input_invalid = True
 	while state_input_invalid:
 		user_state_input = input("\n\tEnter a state (full name): ").strip()
-		if not user_state_input.title() in list_of_states: 
+		if not user_state_input.title() in set_of_states: 
 			print("\tInvalid State. Try Again.") 
 		else: 
 			state_input_invalid = False
@@ -121,6 +158,17 @@ def getQuesionIDFromUser(questions):
 
 # ****** MAIN QUERY FUNCTIONS ******
 
+# Headings of the result columns of each query (also used by batch_query.py)
+query_headings = {
+	1: ['Year', 'State', 'Max Cause Of Death', 'Number of Deaths'],
+	2: ['Year', 'Location', '% People Overweight', '% People w/ No Exercise'],
+	3: ['Year', 'State', 'Max Cause of Death', '% People w/ No Exercise'],
+	4: ['Stratification Category', 'Stratification', 'Data Value Unit', 'Data Value Type', 'Data Value'],
+	5: ['Stratification Category', 'Stratification', 'Data Value Unit', 'Data Value Type', 'Data Value'],
+	6: ['Year', 'State', '% People w/ No Exercise', 'Leading Causes Of Death', 'Deaths', 'Age Adjusted Death Rate'],
+	7: ['Sex', 'Race', 'AgeRange', 'Deaths', 'Population', 'Deaths % of Population']
+}
+
 def runQueryOne(): 
 	'''
 		Function to run the first query. 
@@ -138,7 +186,7 @@ def runQueryOne():
 	
 	# Use the user input to run the main query 
 	results = Database.queryOne(user_year_input)
-	headings = ['Year', 'State', 'Max Cause Of Death', 'Number of Deaths']
+	headings = query_headings[1]
 	prettyPrintResults(results, headings)
 
 def runQueryTwo(): 
@@ -158,7 +206,7 @@ def runQueryTwo():
 
 	# Use the user input to run the main query 
 	results = Database.queryTwo(user_year_input)
-	headings = ['Year', 'Location', '% People Overweight', '% People w/ No Exercise']
+	headings = query_headings[2]
 	prettyPrintResults(results, headings)
 
 def runQueryThree(): 
@@ -180,7 +228,7 @@ def runQueryThree():
 
 	# Use the user input to run the main query 
 	results = Database.queryThree(user_year_input)
-	headings = ['Year', 'State', 'Max Cause of Death', '% People w/ No Exercise']
+	headings = query_headings[3]
 	prettyPrintResults(results, headings)	
 	
 def runQueryFour(): 
@@ -202,11 +250,7 @@ def runQueryFour():
 	user_end_year_input = getYearFromUser((year_ranges[2], year_ranges[3]))
 
 	# Get User input for a state
-	states = Database.getCDIStates()
-	list_of_states = []
-	for row in states: 
-		list_of_states.append(row[0])
-	user_state = getStateFromUser(list_of_states)
+	user_state = getStateFromUser(Database.getValidationCatalog().state_sets['ChronicDiseaseIndicator'])
 
 	# Get the topic from the user 
 	print()
@@ -228,7 +272,7 @@ def runQueryFour():
 	# each demographic. 
 	print("\n\tResults for Years: {}-{}, State: {}, \n\tQuestion: {}".format(user_start_year_input, user_end_year_input, user_state, user_question))
 	results = Database.queryFour(user_start_year_input, user_end_year_input, user_state, user_questionid)
-	headings = ['Stratification Category', 'Stratification', 'Data Value Unit', 'Data Value Type', 'Data Value']
+	headings = query_headings[4]
 	prettyPrintResults(results, headings)
 
 def runQueryFive(): 
@@ -247,11 +291,7 @@ def runQueryFive():
 	user_year_input = getYearFromUser(year_range)
 
 	#Get user input for a state
-	states = Database.getNutritionStates()
-	list_of_states = []
-	for row in states: 
-		list_of_states.append(row[0])
-	user_state = getStateFromUser(list_of_states)
+	user_state = getStateFromUser(Database.getValidationCatalog().state_sets['Nutrition'])
 
 	# Get the topic from the user
 	print()
@@ -272,7 +312,7 @@ def runQueryFive():
 	# each demographic. 
 	print("\n\tResults for Year: {}, State: {}, \n\tQuestion: {}".format(user_year_input, user_state, user_question))
 	results = Database.queryFive(user_year_input, user_state, user_questionid)
-	headings = ['Stratification Category', 'Stratification', 'Data Value Unit', 'Data Value Type', 'Data Value']
+	headings = query_headings[5]
 	prettyPrintResults(results, headings)
 
 def runQuerySix(): 
@@ -294,7 +334,7 @@ def runQuerySix():
 
 	# Use the user input to run the main query 
 	results = Database.querySix(user_year_input)
-	headings = ['Year', 'State', '% People w/ No Exercise', 'Leading Causes Of Death', 'Deaths', 'Age Adjusted Death Rate']
+	headings = query_headings[6]
 	prettyPrintResults(results, headings)	
 
 def runQuerySeven(): 
@@ -311,14 +351,14 @@ def runQuerySeven():
 	user_year = getYearFromUser(valid_years)
 
 	#Get state input from the user 
-	valid_states = Database.getDrugPoisoningStates()
+	valid_states = set(Database.getDrugPoisoningStates())
 	user_state = getStateFromUser(valid_states)
 
 	#Run the main query and display the results 
 	print("\n\tResults for Year: {}, State: {}".format(user_year, user_state))
 	results = Database.querySeven(user_year, user_state)
 	results = sorted(results, key = lambda x: (x[0], x[1], x[2]))
-	headings = ['Sex', 'Race', 'AgeRange', 'Deaths', 'Population', 'Deaths %% of Population']
+	headings = query_headings[7]
 
 	prettyPrintResults(results, headings)
 
@@ -326,74 +366,80 @@ def runQuerySeven():
 
 
 # ****** MAIN PROGRAM ******
+if __name__ == "__main__":
 
-# Initial Output
-print("\n\n\t**********************************************************************************")
-print("\t\tWelcome to the Data Exploration Application for four NCHS datasets!")
+	# Initial Output
+	print("\n\n\t**********************************************************************************")
+	print("\t\tWelcome to the Data Exploration Application for four NCHS datasets!")
 
 
-# Prompt the user to explore the dataset until they enter "E" to end. 
-end_of_program = False
-while not end_of_program:
+	# Prompt the user to explore the dataset until they enter "E" to end. 
+	end_of_program = False
+	while not end_of_program:
 
-	# Get the user query choice 
-	print("\t**********************************************************************************")
-	printQueryOptions()
-	user_query_choice = input("\n\tPlease enter the number for to the discovery option you would like to run (or enter 'E' to end): ")
+		# Get the user query choice 
+		print("\t**********************************************************************************")
+		printQueryOptions()
+		user_query_choice = input("\n\tPlease enter the number for to the discovery option you would like to run (or enter 'E' to end): ")
 
-	# Get other input from the user based on query choice
+		# Get other input from the user based on query choice
 
-	# Check if the user would like to end. 
-	if user_query_choice.upper() == 'E': 
-		print("\n\tProgram Ended.")
-		end_of_program = True
-		continue
+		# Check if the user would like to end. 
+		if user_query_choice.upper() == 'E': 
+			print("\n\tProgram Ended.")
+			end_of_program = True
+			continue
 
-	# Make sure the input is valid.
-	elif not user_query_choice.isdigit() or int(user_query_choice) < 1 or int(user_query_choice) > 7:
-		print("\n\t'{}' was not a valid choice.".format(user_query_choice))
-		continue
+		# Make sure the input is valid.
+		elif not user_query_choice.isdigit() or int(user_query_choice) < 1 or int(user_query_choice) > 7:
+			print("\n\t'{}' was not a valid choice.".format(user_query_choice))
+			continue
 
-	# Query 1
-	elif int(user_query_choice) == 1: 	
-		runQueryOne()
+		# Pick up a new load of the database (if there was one) once per query, 
+		# not at every prompt. (Query 7 only reads the XML file.)
+		if int(user_query_choice) != 7: 
+			Database.checkDataVersion()
+
+		# Query 1
+		if int(user_query_choice) == 1: 	
+			runQueryOne()
 	
-	# Query 2
-	elif int(user_query_choice) == 2: 
-		runQueryTwo()
+		# Query 2
+		elif int(user_query_choice) == 2: 
+			runQueryTwo()
 
-	# Query 3
-	elif int(user_query_choice) == 3: 
-		runQueryThree()
+		# Query 3
+		elif int(user_query_choice) == 3: 
+			runQueryThree()
 
-	# Query 4
-	elif int(user_query_choice) == 4: 
-		runQueryFour()		
+		# Query 4
+		elif int(user_query_choice) == 4: 
+			runQueryFour()		
 
-	# Query 5
-	elif int(user_query_choice) == 5: 
-		runQueryFive()
+		# Query 5
+		elif int(user_query_choice) == 5: 
+			runQueryFive()
 
-	# Query 6
-	elif int(user_query_choice) == 6: 
-		runQuerySix()
+		# Query 6
+		elif int(user_query_choice) == 6: 
+			runQuerySix()
 
-	# Query 7
-	elif int(user_query_choice) == 7: 
-		runQuerySeven()
+		# Query 7
+		elif int(user_query_choice) == 7: 
+			runQuerySeven()
 
-	# 'Default' case, if all other if statements fail. 
-	else: 
-		print("\n\t'{}' was not a valid choice.".format(user_query_choice))
-		continue
+		# 'Default' case, if all other if statements fail. 
+		else: 
+			print("\n\t'{}' was not a valid choice.".format(user_query_choice))
+			continue
 
-	# Check if the user would like to continue. If not, end the program.
-	user_continue_choice = input("\n\tEnter 'E' if you would like to end. (Enter anything else to continue): ")
-	print()
-	if user_continue_choice.upper() == 'E': 
-		print("\n\tProgram Ended.")
-		end_of_program = True
+		# Check if the user would like to continue. If not, end the program.
+		user_continue_choice = input("\n\tEnter 'E' if you would like to end. (Enter anything else to continue): ")
+		print()
+		if user_continue_choice.upper() == 'E': 
+			print("\n\tProgram Ended.")
+			end_of_program = True
 
-print("\t**********************************************************************************")
+	print("\t**********************************************************************************")
 
 
@@ -0,0 +1,192 @@
+import asyncio
+import psycopg_pool
+import Database
+
+# Asyncio versions of the Database.py functions, for use from an async web
+# front end. The SQL runs on psycopg 3 (pip install "psycopg[binary]" psycopg_pool),
+# which uses the same %s placeholders as psycopg2, so the query strings are
+# shared with Database.py. The drug poisoning data is not in the database, so
+# querySeven and its helpers run the Database.py functions in the default
+# executor to keep the event loop free. Every function returns the same rows
+# (lists of column values, in the same order) as its Database.py version.
+
+
+# Connection pool for the database. It is created the first time a query
+# needs a connection, with the same pool_settings as Database.py.
+pool = None
+pool_lock = asyncio.Lock()
+
+async def getPool():
+	'''
+		Function to get the async connection pool, opening it on first use.
+	'''
+	global pool
+	async with pool_lock:
+		if pool is None:
+			settings = Database.pool_settings
+			new_pool = psycopg_pool.AsyncConnectionPool(Database.connection_string,
+				min_size=settings['min_connections'], max_size=settings['max_connections'],
+				timeout=settings['checkout_timeout'], open=False,
+				kwargs={
+					'connect_timeout': settings['connect_timeout'],
+					'options': "-c statement_timeout={}".format(settings['statement_timeout'])
+				})
+			await new_pool.open()
+			pool = new_pool
+		return pool
+
+async def closePool():
+	'''
+		Function to close all of the connections in the async pool.
+	'''
+	global pool
+	async with pool_lock:
+		if pool is not None:
+			await pool.close()
+		pool = None
+
+async def fetchAll(query_string, parameters=()):
+	'''
+		Function to run one query on a pooled connection and return all
+		of its rows as lists.
+	'''
+	connection_pool = await getPool()
+	async with connection_pool.connection() as connection:
+		async with connection.cursor(row_factory=lambda cursor: list) as cursor:
+			await cursor.execute(query_string, parameters)
+			return await cursor.fetchall()
+
+async def runInExecutor(function, *args):
+	'''
+		Function to run a blocking function in the default executor.
+	'''
+	return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+# **** HELPER QUERY FUNCTIONS ****
+
+async def getYearRangeForLeadingCauseOfDeath():
+	'''
+		Async version of Database.getYearRangeForLeadingCauseOfDeath.
+	'''
+	min_year, max_year = (await fetchAll(Database.year_range_for_leading_cause_of_death_sql))[0]
+	return (min_year, max_year)
+
+async def getYearRangeForNutrition():
+	'''
+		Async version of Database.getYearRangeForNutrition.
+	'''
+	min_year, max_year = (await fetchAll(Database.year_range_for_nutrition_sql))[0]
+	return (min_year, max_year)
+
+async def getNutritionStates():
+	'''
+		Async version of Database.getNutritionStates.
+	'''
+	return await fetchAll(Database.nutrition_states_sql)
+
+async def getTopicsForNutrition():
+	'''
+		Async version of Database.getTopicsForNutrition.
+	'''
+	return await fetchAll(Database.topics_for_nutrition_sql)
+
+async def getNutritionQuestionsForTopicID(topicid):
+	'''
+		Async version of Database.getNutritionQuestionsForTopicID.
+	'''
+	return await fetchAll(Database.nutrition_questions_for_topic_id_sql, (topicid,))
+
+async def getYearStartYearEndRangesCDI():
+	'''
+		Async version of Database.getYearStartYearEndRangesCDI.
+	'''
+	min_year_start, max_year_start, min_year_end, max_year_end = (await fetchAll(Database.year_start_year_end_ranges_cdi_sql))[0]
+	return (min_year_start, max_year_start, min_year_end, max_year_end)
+
+async def getCDIStates():
+	'''
+		Async version of Database.getCDIStates.
+	'''
+	return await fetchAll(Database.cdi_states_sql)
+
+async def getTopicsForCDI():
+	'''
+		Async version of Database.getTopicsForCDI.
+	'''
+	return await fetchAll(Database.topics_for_cdi_sql)
+
+async def getCDIQuestionsForTopicID(topicid):
+	'''
+		Async version of Database.getCDIQuestionsForTopicID.
+	'''
+	return await fetchAll(Database.cdi_questions_for_topic_id_sql, (topicid,))
+
+async def getDrugPoisoningYears():
+	'''
+		Async version of Database.getDrugPoisoningYears.
+	'''
+	return await runInExecutor(Database.getDrugPoisoningYears)
+
+async def getDrugPoisoningStates():
+	'''
+		Async version of Database.getDrugPoisoningStates.
+	'''
+	return await runInExecutor(Database.getDrugPoisoningStates)
+
+
+# **** MAIN QUERY FUNCTIONS ****
+
+async def queryOne(year):
+	'''
+		Async version of Database.queryOne.
+	'''
+	return await fetchAll(Database.query_one_sql, (year,))
+
+async def queryOneAllYears():
+	'''
+		Async version of Database.queryOneAllYears.
+	'''
+	return await fetchAll(Database.query_one_all_years_sql)
+
+async def queryTwo(year):
+	'''
+		Async version of Database.queryTwo.
+	'''
+	return await fetchAll(Database.query_two_sql, (year, year, year, year))
+
+async def queryThree(year):
+	'''
+		Async version of Database.queryThree.
+	'''
+	return await fetchAll(Database.query_three_sql, (year, year, year))
+
+async def queryFour(yearstart, yearend, state, questionid):
+	'''
+		Async version of Database.queryFour.
+	'''
+	return await fetchAll(Database.query_four_sql, (yearstart, yearend, state, questionid))
+
+async def queryFive(year, state, questionid):
+	'''
+		Async version of Database.queryFive.
+	'''
+	return await fetchAll(Database.query_five_sql, (year, state, questionid))
+
+async def querySix(year):
+	'''
+		Async version of Database.querySix.
+	'''
+	return await fetchAll(Database.query_six_sql, (year, year, year))
+
+async def querySeven(user_year, user_state):
+	'''
+		Async version of Database.querySeven.
+	'''
+	return await runInExecutor(Database.querySeven, user_year, user_state)
+
+async def queryDrugPoisoning(year_start=None, year_end=None, states=None, sexes=None, races=None, age_ranges=None, group_by=('year',)):
+	'''
+		Async version of Database.queryDrugPoisoning.
+	'''
+	return await runInExecutor(Database.queryDrugPoisoning, year_start, year_end, states, sexes, races, age_ranges, group_by)
@@ -1,35 +1,863 @@
+from array import array
+import bisect
+from collections import OrderedDict
+import copy
+import functools
+import hashlib
+import mmap
+import operator
+import os
+import struct
+import sys
+import threading
+import time
+from contextlib import contextmanager
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
 import psycopg2.extras
+import psycopg2.pool
 from lxml import etree
 
 
-# Create a connection with the database
+# Connection pool for the database. The pool is only created the first time a 
+# query needs a connection (see getCursor), so importing this module is cheap. 
+# The pool_settings can be changed with configurePool.
 connection_string = "host='localhost' dbname='dbms_final_project' user='dbms_project_user' password='dbms_password'"
-conn = psycopg2.connect(connection_string)
-cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+pool_settings = {
+	'min_connections': 1, 
+	'max_connections': 10, 
+	'checkout_timeout': 30,		# seconds to wait for a free connection
+	'connect_timeout': 10,		# seconds to wait when opening a new connection
+	'statement_timeout': 0		# milliseconds a query may run for (0 means no limit)
+}
+pool = None
+pool_slots = None
+pool_lock = threading.Lock()
 
-# Set up for XML parsing and querying
+def configurePool(**settings): 
+	'''
+		Function to change the pool settings (the keys of pool_settings). 
+		An open pool is closed, and the next query opens a new one with 
+		the new settings.
+	'''
+	for name in settings: 
+		if name not in pool_settings: 
+			raise ValueError("Unknown pool setting: {}".format(name))
+	closePool()
+	pool_settings.update(settings)
+
+def closePool(): 
+	'''
+		Function to close all of the connections in the pool.
+	'''
+	global pool, pool_slots
+	with pool_lock: 
+		if pool is not None: 
+			pool.closeall()
+		pool = None
+		pool_slots = None
+
+def getPool(): 
+	'''
+		Function to get the connection pool and the semaphore that counts 
+		its free connections, creating them on first use.
+	'''
+	global pool, pool_slots
+	with pool_lock: 
+		if pool is None: 
+			pool = psycopg2.pool.ThreadedConnectionPool(pool_settings['min_connections'], pool_settings['max_connections'], 
+				connection_string, connect_timeout=pool_settings['connect_timeout'], 
+				options="-c statement_timeout={}".format(pool_settings['statement_timeout']))
+			pool_slots = threading.BoundedSemaphore(pool_settings['max_connections'])
+		return pool, pool_slots
+
+@contextmanager
+def getCursor(name=None, cursor_factory=psycopg2.extras.DictCursor): 
+	'''
+		Function to check out a connection from the pool and open a new 
+		DictCursor on it. Use it as "with getCursor() as cursor:"; the 
+		connection goes back to the pool at the end of the block. Waits up 
+		to checkout_timeout seconds for a free connection, and then raises 
+		psycopg2.pool.PoolError. 
+		If a name is given, the cursor is a named (server-side) cursor. 
+		cursor_factory=None gives a plain cursor, whose rows are tuples.
+	'''
+	connection_pool, slots = getPool()
+	if not slots.acquire(timeout=pool_settings['checkout_timeout']): 
+		raise psycopg2.pool.PoolError("No database connection was free after {} seconds".format(pool_settings['checkout_timeout']))
+	try: 
+		connection = connection_pool.getconn()
+		try: 
+			with connection.cursor(name=name, cursor_factory=cursor_factory) as cursor: 
+				yield cursor
+		finally: 
+			# End the (read only) transaction, and drop the connection if it is broken
+			broken = connection.closed or connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+			if not broken: 
+				connection.rollback()
+			connection_pool.putconn(connection, close=broken)
+	finally: 
+		slots.release()
+
+# **** DRUG POISONING (XML) DATA ****
+
+# Binary snapshot of the drug poisoning data that load_data.py writes next to 
+# the XML file, so the XML does not have to be parsed at every start up. 
+# Layout (little endian, every section padded to a multiple of 8 bytes; the typed 
+# arrays are byte swapped on big endian machines, see littleEndianBytes): 
+#	header: magic, size, mtime (ns) and sha256 of the XML file, row count, index entry count
+#	string tables: state, sex and race names (byte length, then NUL separated UTF-8)
+#	columns: one typed array per entry of snapshot_columns
+#	index: one typed array per entry of snapshot_index_columns
+snapshot_magic = b"DPSNAP01"
+snapshot_header = struct.Struct("<8sQq32sQQ")
+snapshot_columns = (('years', 'h'), ('states', 'H'), ('sexes', 'B'), ('races', 'B'), 
+	('lower_ages', 'h'), ('upper_ages', 'h'), ('deaths', 'q'), ('populations', 'q'))
+snapshot_index_columns = (('years', 'h'), ('states', 'H'), ('starts', 'q'), ('ends', 'q'))
+
+def fileDigest(filename): 
+	'''
+		Function to compute the sha256 digest of a file.
+	'''
+	digest = hashlib.sha256()
+	with open(filename, 'rb') as file: 
+		for block in iter(lambda: file.read(1 << 20), b''): 
+			digest.update(block)
+	return digest.digest()
+
+def littleEndianBytes(values): 
+	'''
+		Function to get the bytes of a typed array in little endian order.
+	'''
+	if sys.byteorder != 'little': 
+		values = array(values.typecode, values)
+		values.byteswap()
+	return values.tobytes()
+
+def paddedLength(length): 
+	'''
+		Function to round a length up to a multiple of 8 bytes.
+	'''
+	return (length + 7) & ~7
+
+class DrugPoisoningData: 
+	'''
+		Class that holds the drug poisoning statistics from the XML file 
+		in a compact, column-oriented form. Every column is a typed array 
+		(or a list of small integer codes into a table of distinct strings), 
+		and the rows are sorted by (year, state) so that all of the rows for 
+		one year and state are next to each other. The index maps 
+		(year, lowercase state) to the (start, end) range of those rows.
+	'''
+
+	def __init__(self, state_names, sex_names, race_names, columns, index): 
+		'''
+			Inputs: state_names, sex_names, race_names - the distinct strings
+					columns - dictionary with a typed array (or memoryview) for 
+					each column named in snapshot_columns
+					index - dictionary of (year, lowercase state) -> (start, end)
+		'''
+		self.state_names = state_names
+		self.sex_names = sex_names
+		self.race_names = race_names
+		self.years = columns['years']
+		self.states = columns['states']
+		self.sexes = columns['sexes']
+		self.races = columns['races']
+		self.lower_ages = columns['lower_ages']
+		self.upper_ages = columns['upper_ages']
+		self.deaths = columns['deaths']
+		self.populations = columns['populations']
+		self.index = index
+
+	@classmethod
+	def fromRows(cls, rows): 
+		'''
+			Builds the columns and the index from an iterable of rows formatted as: 
+			(year, state, sex, race, lower age, upper age, deaths, population)
+		'''
+		builder = DrugPoisoningDataBuilder()
+		for row in rows: 
+			builder.add(*row)
+		return builder.build()
+
+	@classmethod
+	def fromXML(cls, tree): 
+		'''
+			Builds the columns and the index from a parsed XML tree.
+		'''
+		return cls.fromRows(
+			(
+				int(stat.findtext('Year')), 
+				stat.findtext('State'), 
+				stat.findtext('Sex'), 
+				stat.findtext('Race'), 
+				int(stat.findtext('AgeRange/LowerBound')), 
+				int(stat.findtext('AgeRange/UpperBound')), 
+				int(stat.findtext('Deaths')), 
+				int(stat.findtext('Population'))
+			)
+			for stat in tree.iterfind('DrugPoisoningStatistic')
+		)
+
+	@classmethod
+	def fromSnapshot(cls, snapshot_filename, xml_filename): 
+		'''
+			Memory-maps a snapshot written by writeSnapshot. The columns are 
+			views into the mapped file, so nothing is parsed or copied (except 
+			on big endian machines, where they are copied and byte swapped). 
+			Returns None if the snapshot is missing, is not a snapshot, or 
+			was not written for the current contents of the XML file (same 
+			size, and the same mtime or sha256).
+		'''
+		try: 
+			xml_stat = os.stat(xml_filename)
+			with open(snapshot_filename, 'rb') as snapshot_file: 
+				snapshot = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+		except (OSError, ValueError): 
+			return None
+
+		if len(snapshot) < snapshot_header.size: 
+			return None
+		magic, xml_size, xml_mtime, xml_digest, row_count, index_count = snapshot_header.unpack_from(snapshot)
+		if magic != snapshot_magic or xml_size != xml_stat.st_size: 
+			return None
+		if xml_mtime != xml_stat.st_mtime_ns and xml_digest != fileDigest(xml_filename): 
+			return None
+
+		view = memoryview(snapshot)
+		offset = snapshot_header.size
+
+		string_tables = []
+		for i in range(3): 
+			length = struct.unpack_from("<Q", snapshot, offset)[0]
+			offset += 8
+			text = bytes(view[offset:offset + length]).decode('utf-8')
+			string_tables.append(text.split('\0') if length > 0 else [])
+			offset = paddedLength(offset + length)
+
+		def readColumns(column_types, length): 
+			nonlocal offset
+			columns = dict()
+			for name, typecode in column_types: 
+				size = length * struct.calcsize(typecode)
+				columns[name] = view[offset:offset + size].cast(typecode)
+				if sys.byteorder != 'little': 
+					columns[name] = array(typecode, columns[name])
+					columns[name].byteswap()
+				offset = paddedLength(offset + size)
+			return columns
+
+		columns = readColumns(snapshot_columns, row_count)
+		index_columns = readColumns(snapshot_index_columns, index_count)
+
+		state_names, sex_names, race_names = string_tables
+		index = dict()
+		for i in range(index_count): 
+			key = (index_columns['years'][i], state_names[index_columns['states'][i]].lower())
+			index[key] = (index_columns['starts'][i], index_columns['ends'][i])
+
+		return cls(state_names, sex_names, race_names, columns, index)
+
+	def writeSnapshot(self, snapshot_filename, xml_filename): 
+		'''
+			Writes the data to a snapshot file that fromSnapshot can load, 
+			tagged with the size, mtime and sha256 of the XML file it was 
+			built from. The file is written under a temporary name and then 
+			renamed, so a reader never sees a partial snapshot.
+		'''
+		xml_stat = os.stat(xml_filename)
+
+		# The first state name with each lowercase spelling (the index keys are lowercase)
+		lowercase_state_codes = dict()
+		for code, name in enumerate(self.state_names): 
+			lowercase_state_codes.setdefault(name.lower(), code)
+		index_columns = {
+			'years': array('h'), 
+			'states': array('H'), 
+			'starts': array('q'), 
+			'ends': array('q')
+		}
+		for (year, state), (start, end) in self.index.items(): 
+			index_columns['years'].append(year)
+			index_columns['states'].append(lowercase_state_codes[state])
+			index_columns['starts'].append(start)
+			index_columns['ends'].append(end)
+
+		def writePadded(file, data): 
+			file.write(data)
+			file.write(bytes(paddedLength(len(data)) - len(data)))
+
+		temporary_filename = snapshot_filename + ".tmp"
+		with open(temporary_filename, 'wb') as snapshot_file: 
+			snapshot_file.write(snapshot_header.pack(snapshot_magic, xml_stat.st_size, xml_stat.st_mtime_ns, 
+				fileDigest(xml_filename), len(self.years), len(self.index)))
+			for names in (self.state_names, self.sex_names, self.race_names): 
+				text = '\0'.join(names).encode('utf-8')
+				snapshot_file.write(struct.pack("<Q", len(text)))
+				writePadded(snapshot_file, text)
+			for name, typecode in snapshot_columns: 
+				writePadded(snapshot_file, littleEndianBytes(array(typecode, getattr(self, name))))
+			for name, typecode in snapshot_index_columns: 
+				writePadded(snapshot_file, littleEndianBytes(index_columns[name]))
+		os.replace(temporary_filename, snapshot_filename)
+
+	@staticmethod
+	def internStrings(values): 
+		'''
+			Returns the distinct values in the order they first appear.
+		'''
+		return list(dict.fromkeys(values))
+
+	def yearRange(self): 
+		'''
+			Returns the (minimum, maximum) year in the data.
+		'''
+		if len(self.years) == 0: 
+			return (9999, 0)
+		return (self.years[0], self.years[-1])
+
+	def rowsForYearAndState(self, year, state): 
+		'''
+			Returns the query seven rows for a year and state 
+			(state is not case sensitive).
+		'''
+		start, end = self.index.get((int(year), state.lower()), (0, 0))
+		results = []
+		for i in range(start, end): 
+			results.append([
+				self.sex_names[self.sexes[i]], 
+				self.race_names[self.races[i]], 
+				"{}-{}".format(self.lower_ages[i], self.upper_ages[i]), 
+				self.deaths[i], 
+				self.populations[i], 
+				round(self.deaths[i]*100/self.populations[i], 8)
+			])
+		return results
+
+	# The columns that aggregate can group by, and the positions of their values in the row tuples it builds
+	group_by_positions = {'year': (0,), 'state': (1,), 'sex': (2,), 'race': (3,), 'age': (4, 5)}
+
+	@staticmethod
+	def codesFor(names, wanted): 
+		'''
+			Returns the set of codes of the names that are in wanted (not 
+			case sensitive), or None if wanted is None (no filter).
+		'''
+		if wanted is None: 
+			return None
+		wanted = set(name.lower() for name in wanted)
+		return set(code for code, name in enumerate(names) if name.lower() in wanted)
+
+	def aggregate(self, year_start=None, year_end=None, states=None, sexes=None, races=None, age_ranges=None, group_by=('year',)): 
+		'''
+			Sums up the deaths and populations of the rows that pass the filters, 
+			for each distinct combination of the group_by columns ('year', 'state', 
+			'sex', 'race' and 'age'). 
+			Filters: year_start, year_end - inclusive year range (None for no limit)
+					 states, sexes, races - lists of names (not case sensitive)
+					 age_ranges - list of age ranges formatted as in query seven, e.g. "15-24"
+			Returns rows of the group_by values, the summed deaths, the summed 
+			population, and the deaths as a % of the population (the population 
+			weighted rate), sorted by the group_by values. 
+			The data has rows that are totals of other rows (the 'United States' 
+			state, 'Both Sexes', 'All Races-All Origins' and the 0-150 age range), 
+			so filter on the totals wanted rather than summing over them. 
+			Rows with missing deaths or population (the -1 that load_data.py 
+			writes for an empty field) are left out of the sums altogether.
+		'''
+		for column in group_by: 
+			if column not in self.group_by_positions: 
+				raise ValueError("Cannot group by '{}' (choose from {})".format(column, ", ".join(self.group_by_positions)))
+
+		# The rows are sorted by year, so a year range is one contiguous slice of the columns
+		start = 0 if year_start is None else bisect.bisect_left(self.years, year_start)
+		end = len(self.years) if year_end is None else bisect.bisect_right(self.years, year_end)
+
+		state_codes = self.codesFor(self.state_names, states)
+		sex_codes = self.codesFor(self.sex_names, sexes)
+		race_codes = self.codesFor(self.race_names, races)
+		age_bounds = None
+		if age_ranges is not None: 
+			age_bounds = set()
+			for age_range in age_ranges: 
+				lower_age, separator, upper_age = age_range.partition('-')
+				if not separator or not lower_age.strip().isdigit() or not upper_age.strip().isdigit(): 
+					raise ValueError("'{}' is not an age range (e.g. 15-24)".format(age_range))
+				age_bounds.add((int(lower_age), int(upper_age)))
+
+		positions = [position for column in group_by for position in self.group_by_positions[column]]
+		if len(positions) == 0: 
+			groupKey = lambda row: ()
+		elif len(positions) == 1: 
+			position = positions[0]
+			groupKey = lambda row: (row[position],)
+		else: 
+			groupKey = operator.itemgetter(*positions)
+
+		death_totals = dict()
+		population_totals = dict()
+		rows = zip(self.years[start:end], self.states[start:end], self.sexes[start:end], self.races[start:end], 
+			self.lower_ages[start:end], self.upper_ages[start:end], self.deaths[start:end], self.populations[start:end])
+		for row in rows: 
+			if state_codes is not None and row[1] not in state_codes: 
+				continue
+			if sex_codes is not None and row[2] not in sex_codes: 
+				continue
+			if race_codes is not None and row[3] not in race_codes: 
+				continue
+			if age_bounds is not None and (row[4], row[5]) not in age_bounds: 
+				continue
+			if row[6] < 0 or row[7] < 0: 
+				continue
+			key = groupKey(row)
+			death_totals[key] = death_totals.get(key, 0) + row[6]
+			population_totals[key] = population_totals.get(key, 0) + row[7]
+
+		results = []
+		for key, deaths in death_totals.items(): 
+			values = iter(key)
+			group_values = []
+			for column in group_by: 
+				if column == 'year': 
+					group_values.append(next(values))
+				elif column == 'state': 
+					group_values.append(self.state_names[next(values)])
+				elif column == 'sex': 
+					group_values.append(self.sex_names[next(values)])
+				elif column == 'race': 
+					group_values.append(self.race_names[next(values)])
+				else: 
+					group_values.append((next(values), next(values)))
+			population = population_totals[key]
+			rate = round(deaths*100/population, 8) if population else None
+			results.append(group_values + [deaths, population, rate])
+
+		# Sorted with the age ranges as (lower, upper) numbers, which are then formatted
+		results.sort(key=lambda result: result[:len(group_by)])
+		for i, column in enumerate(group_by): 
+			if column == 'age': 
+				for result in results: 
+					result[i] = "{}-{}".format(*result[i])
+		return results
+
+class DrugPoisoningDataBuilder: 
+	'''
+		Collects drug poisoning rows one at a time straight into the typed 
+		arrays of a DrugPoisoningData (the strings as codes), so that the 
+		rows themselves are never kept. build() then sorts the columns.
+	'''
+
+	def __init__(self): 
+		# Distinct strings -> codes, in the order they first appear in the file
+		self.state_codes = dict()
+		self.sex_codes = dict()
+		self.race_codes = dict()
+		self.columns = {name: array(type_code) for name, type_code in snapshot_columns}
+
+	def add(self, year, state, sex, race, lower_age, upper_age, deaths, population): 
+		'''
+			Appends one row to the columns.
+		'''
+		columns = self.columns
+		columns['years'].append(year)
+		columns['states'].append(self.state_codes.setdefault(state, len(self.state_codes)))
+		columns['sexes'].append(self.sex_codes.setdefault(sex, len(self.sex_codes)))
+		columns['races'].append(self.race_codes.setdefault(race, len(self.race_codes)))
+		columns['lower_ages'].append(lower_age)
+		columns['upper_ages'].append(upper_age)
+		columns['deaths'].append(deaths)
+		columns['populations'].append(population)
+
+	def build(self): 
+		'''
+			Sorts the rows by (year, state), builds the index and returns 
+			the DrugPoisoningData. Rows keep their file order within a 
+			(year, state) group, as with a stable sort.
+		'''
+		state_names = list(self.state_codes)
+		lower_state_names = [name.lower() for name in state_names]
+		def groupKeys(): 
+			return ((year, lower_state_names[state]) for year, state in zip(self.columns['years'], self.columns['states']))
+
+		# Count the rows of each (year, state) to find where each group starts once sorted
+		counts = dict()
+		for key in groupKeys(): 
+			counts[key] = counts.get(key, 0) + 1
+		index = dict()
+		next_positions = dict()
+		start = 0
+		for key in sorted(counts): 
+			index[key] = (start, start + counts[key])
+			next_positions[key] = start
+			start += counts[key]
+
+		# The sorted position of every row, and then every column in that order
+		positions = array('q')
+		for key in groupKeys(): 
+			positions.append(next_positions[key])
+			next_positions[key] += 1
+		columns = dict()
+		for name, column in self.columns.items(): 
+			sorted_column = array(column.typecode, column)
+			for position, value in zip(positions, column): 
+				sorted_column[position] = value
+			columns[name] = sorted_column
+
+		return DrugPoisoningData(state_names, list(self.sex_codes), list(self.race_codes), columns, index)
+
+# Set up for XML parsing and querying. The drug poisoning data is only loaded 
+# the first time it is needed (see getDrugPoisoningData), from the snapshot if 
+# it is up to date and from the XML file otherwise, and again whenever the XML 
+# file changes. (The database is not needed for any of it.)
 xml_file = 'drug-poisoning-mortality-data.xml'
-parser = etree.XMLParser(ns_clean=True)
-tree = etree.parse(xml_file, parser)
+snapshot_file = 'drug-poisoning-mortality-data.snapshot'
+drug_poisoning_data = None
+drug_poisoning_data_version = None
+drug_poisoning_lock = threading.Lock()
+
+def getDrugPoisoningFileVersion(): 
+	'''
+		Function to get the version of the drug poisoning XML file: its 
+		modification time and size (None if there is no file). load_data.py 
+		writes a new file for every load.
+	'''
+	try: 
+		stat = os.stat(xml_file)
+	except FileNotFoundError: 
+		return None
+	return (stat.st_mtime_ns, stat.st_size)
+
+def getDrugPoisoningData(): 
+	'''
+		Function to get the DrugPoisoningData, loading it on first use 
+		and after the XML file has changed.
+	'''
+	global drug_poisoning_data, drug_poisoning_data_version
+	version = getDrugPoisoningFileVersion()
+	with drug_poisoning_lock: 
+		if version != drug_poisoning_data_version: 
+			drug_poisoning_data = None
+		if drug_poisoning_data is None: 
+			# (the version is taken before the file is read, so a file written meanwhile is read again next time)
+			drug_poisoning_data_version = version
+			drug_poisoning_data = DrugPoisoningData.fromSnapshot(snapshot_file, xml_file)
+		if drug_poisoning_data is None: 
+			parser = etree.XMLParser(ns_clean=True)
+			tree = etree.parse(xml_file, parser)
+			drug_poisoning_data = DrugPoisoningData.fromXML(tree)
+		return drug_poisoning_data
+
+# **** LOW MEMORY (STREAMED XML) MODE ****
+
+# With drug_poisoning_settings['low_memory'] set, getDrugPoisoningYears, 
+# getDrugPoisoningStates and querySeven do not load the drug poisoning data. 
+# Instead every call reads the XML file with iterparse, one 
+# DrugPoisoningStatistic at a time, and clears each statistic (and drops it 
+# from the root) once it has been read, so memory use stays the same however 
+# big the file is. Each call is a full pass over the file, so this is only 
+# meant for XML files too big to hold in memory.
+drug_poisoning_settings = {
+	'low_memory': False
+}
+
+# Compiled once, and evaluated on each DrugPoisoningStatistic element
+statistic_xpaths = {
+	'year': etree.XPath("string(Year)", smart_strings=False), 
+	'state': etree.XPath("string(State)", smart_strings=False), 
+	'sex': etree.XPath("string(Sex)", smart_strings=False), 
+	'race': etree.XPath("string(Race)", smart_strings=False), 
+	'lower_age': etree.XPath("string(AgeRange/LowerBound)", smart_strings=False), 
+	'upper_age': etree.XPath("string(AgeRange/UpperBound)", smart_strings=False), 
+	'deaths': etree.XPath("string(Deaths)", smart_strings=False), 
+	'population': etree.XPath("string(Population)", smart_strings=False)
+}
+
+def iterDrugPoisoningStatistics(xml_filename): 
+	'''
+		Generator that yields each DrugPoisoningStatistic element of the 
+		XML file as soon as it has been parsed. The element is cleared 
+		when the next one is requested.
+	'''
+	for event, statistic in etree.iterparse(xml_filename, events=('end',), tag='DrugPoisoningStatistic'): 
+		yield statistic
+		statistic.clear()
+		while statistic.getprevious() is not None: 
+			del statistic.getparent()[0]
+
+def streamDrugPoisoningYears(xml_filename): 
+	'''
+		Function to get the (minimum, maximum) year in the XML file 
+		in one pass over it.
+	'''
+	min_year, max_year = (9999, 0)
+	year_xpath = statistic_xpaths['year']
+	for statistic in iterDrugPoisoningStatistics(xml_filename): 
+		year = int(year_xpath(statistic))
+		min_year = min(min_year, year)
+		max_year = max(max_year, year)
+	return (min_year, max_year)
+
+def streamDrugPoisoningStates(xml_filename): 
+	'''
+		Function to get the distinct states in the XML file, in the 
+		order they first appear, in one pass over it.
+	'''
+	state_xpath = statistic_xpaths['state']
+	return DrugPoisoningData.internStrings(state_xpath(statistic) for statistic in iterDrugPoisoningStatistics(xml_filename))
+
+def streamRowsForYearAndState(xml_filename, year, state): 
+	'''
+		Function to get the query seven rows for a year and state (not 
+		case sensitive) in one pass over the XML file, in file order.
+	'''
+	year = str(int(year))
+	state = state.lower()
+	xpaths = statistic_xpaths
+	results = []
+	for statistic in iterDrugPoisoningStatistics(xml_filename): 
+		if xpaths['year'](statistic) != year or xpaths['state'](statistic).lower() != state: 
+			continue
+		deaths = int(xpaths['deaths'](statistic))
+		population = int(xpaths['population'](statistic))
+		results.append([
+			xpaths['sex'](statistic), 
+			xpaths['race'](statistic), 
+			"{}-{}".format(int(xpaths['lower_age'](statistic)), int(xpaths['upper_age'](statistic))), 
+			deaths, 
+			population, 
+			round(deaths*100/population, 8)
+		])
+	return results
+
+# **** QUERY RESULT CACHE ****
+
+# The results of the parameterized query functions (marked with @cachedQuery) 
+# are kept in one LRU cache of at most max_entries results. load_data.py bumps 
+# the version in the DataVersion table whenever it commits a load, and the cache 
+# is emptied when that version changes. The version is read at most once every 
+# version_check_interval seconds (0 checks on every call). Queries that do not 
+# use the database (querySeven) are instead cached under the version of their 
+# file, so that they never connect to the database.
+cache_settings = {
+	'max_entries': 256, 
+	'version_check_interval': 2
+}
+query_cache = OrderedDict()
+cache_stats = {'hits': 0, 'misses': 0}
+cache_lock = threading.Lock()
+cached_data_version = None
+last_version_check = None
+
+data_version_sql = "SELECT Version FROM DataVersion"
+
+def getDataVersion(): 
+	'''
+		Function to get the version of the loaded data (0 if the 
+		database was loaded before versions were recorded).
+	'''
+	with getCursor() as cursor: 
+		try: 
+			cursor.execute(data_version_sql)
+		except psycopg2.errors.UndefinedTable: 
+			return 0
+		rows = cursor.fetchall()
+		return rows[0][0] if rows else 0
+
+def checkDataVersion(): 
+	'''
+		Function to empty the cache (and drop the validation catalog) 
+		if a new load has been committed since the last check.
+	'''
+	global cached_data_version, last_version_check, validation_catalog
+	now = time.monotonic()
+	with cache_lock: 
+		if last_version_check is not None and now - last_version_check < cache_settings['version_check_interval']: 
+			return
+		last_version_check = now
+
+	version = getDataVersion()
+	with cache_lock: 
+		if version != cached_data_version: 
+			query_cache.clear()
+			validation_catalog = None
+			cached_data_version = version
+
+def clearCache(): 
+	'''
+		Function to empty the cache and reset its counters.
+	'''
+	with cache_lock: 
+		query_cache.clear()
+		cache_stats['hits'] = 0
+		cache_stats['misses'] = 0
+
+def getCacheStats(): 
+	'''
+		Function to get the cache counters as a dictionary with the 
+		hits, misses, number of entries, max entries and data version.
+	'''
+	with cache_lock: 
+		return {
+			'hits': cache_stats['hits'], 
+			'misses': cache_stats['misses'], 
+			'entries': len(query_cache), 
+			'max_entries': cache_settings['max_entries'], 
+			'data_version': cached_data_version
+		}
+
+def cachedQuery(function=None, version=None, key=None): 
+	'''
+		Decorator that serves repeated calls of a query function with 
+		the same arguments from the cache. Callers get their own copy 
+		of the list of rows and of each row (rows are lists, which callers 
+		may change). 
+		Options (@cachedQuery(version=..., key=...)): 
+			version - function that returns the version of the data the 
+				query reads, used instead of the database's data version 
+			key - function that normalises the arguments, so that calls 
+				with equivalent arguments share a cache entry
+	'''
+	if function is None: 
+		return functools.partial(cachedQuery, version=version, key=key)
+
+	@functools.wraps(function)
+	def cachedFunction(*args): 
+		if version is None: 
+			checkDataVersion()
+		else: 
+			file_version = version()
+		arguments = key(*args) if key is not None else args
+		with cache_lock: 
+			# The version is part of the key, so a result computed while a new 
+			# load is committed is never served for the new version.
+			data_version = cached_data_version if version is None else file_version
+			cache_key = (data_version, function.__name__) + arguments
+			if cache_key in query_cache: 
+				query_cache.move_to_end(cache_key)
+				cache_stats['hits'] += 1
+				return [copy.copy(row) for row in query_cache[cache_key]]
+			cache_stats['misses'] += 1
+
+		records = function(*args)
+		with cache_lock: 
+			query_cache[cache_key] = records
+			query_cache.move_to_end(cache_key)
+			while len(query_cache) > cache_settings['max_entries']: 
+				query_cache.popitem(last=False)
+		return [copy.copy(row) for row in records]
+	return cachedFunction
+
+# **** VALIDATION CATALOG ****
+
+# The year ranges, states, topics and questions that the menus check the user 
+# input against are read in one query the first time any of them is needed, 
+# and kept until the data version changes (see checkDataVersion). Reading the 
+# catalog does not check the version itself, so the menu prompts make no round 
+# trips: Application.py checks it once at the start of each query. Every row of 
+# validation_catalog_sql is (kind, table, value1, value2, value3, value4).
+validation_catalog_sql = """
+					SELECT 'years', 'LeadingCauseOfDeath', MIN(year)::TEXT, MAX(year)::TEXT, NULL, NULL
+					FROM LeadingCauseOfDeath
+					UNION ALL
+					SELECT 'years', 'Nutrition', MIN(yearstart)::TEXT, MAX(yearstart)::TEXT, NULL, NULL
+					FROM Nutrition
+					UNION ALL
+					SELECT 'years', 'ChronicDiseaseIndicator', MIN(yearstart)::TEXT, MAX(yearstart)::TEXT, MIN(yearend)::TEXT, MAX(yearend)::TEXT
+					FROM ChronicDiseaseIndicator
+					UNION ALL
+					SELECT 'state', 'Nutrition', locationdesc, NULL, NULL, NULL
+					FROM (SELECT DISTINCT locationid FROM Nutrition) AS locations NATURAL JOIN Location
+					UNION ALL
+					SELECT 'state', 'ChronicDiseaseIndicator', locationdesc, NULL, NULL, NULL
+					FROM (SELECT DISTINCT locationid FROM ChronicDiseaseIndicator) AS locations NATURAL JOIN Location
+					UNION ALL
+					SELECT 'question', 'Nutrition', topicid, topic, questionid, question
+					FROM (SELECT DISTINCT topicid, questionid FROM Nutrition) AS questions 
+						NATURAL JOIN TopicInformation NATURAL JOIN QuestionInformation
+					UNION ALL
+					SELECT 'question', 'ChronicDiseaseIndicator', topicid, topic, questionid, question
+					FROM (SELECT DISTINCT topicid, questionid FROM ChronicDiseaseIndicator) AS questions 
+						NATURAL JOIN TopicInformation NATURAL JOIN QuestionInformation
+					"""
+
+class ValidationCatalog: 
+	'''
+		The valid user input for each table: its year range(s), its states 
+		(as a sorted list and as a set), its topics and the questions of 
+		each topic.
+	'''
+
+	def __init__(self, rows): 
+		self.year_ranges = dict()		# table: (min year, max year) or, for ChronicDiseaseIndicator, (min/max yearstart, min/max yearend)
+		self.states = dict()			# table: sorted list of state names
+		self.state_sets = dict()		# table: set of state names
+		self.topics = dict()			# table: list of [topicid, topic]
+		self.questions = dict()			# (table, topicid): list of [question, questionid]
+		for table in ('LeadingCauseOfDeath', 'Nutrition', 'ChronicDiseaseIndicator'): 
+			self.state_sets[table] = set()
+			self.topics[table] = []
+
+		for kind, table, value1, value2, value3, value4 in rows: 
+			if kind == 'years': 
+				values = (value1, value2, value3, value4) if table == 'ChronicDiseaseIndicator' else (value1, value2)
+				self.year_ranges[table] = tuple(int(value) if value is not None else None for value in values)
+			elif kind == 'state': 
+				self.state_sets[table].add(value1)
+			elif kind == 'question': 
+				if (table, value1) not in self.questions: 
+					self.topics[table].append([value1, value2])
+					self.questions[(table, value1)] = []
+				self.questions[(table, value1)].append([value4, value3])
+
+		for table in self.state_sets: 
+			self.states[table] = sorted(self.state_sets[table])
+			self.topics[table].sort()
+		for questions in self.questions.values(): 
+			questions.sort()
+
+validation_catalog = None
+
+def getValidationCatalog(): 
+	'''
+		Function to get the ValidationCatalog, reading it from the 
+		database on first use and after a new load has been seen by 
+		checkDataVersion.
+	'''
+	global validation_catalog
+	# (the version is only checked here if it has never been checked)
+	if cached_data_version is None: 
+		checkDataVersion()
+	with cache_lock: 
+		catalog = validation_catalog
+		catalog_version = cached_data_version
+	if catalog is None: 
+		with getCursor() as cursor: 
+			cursor.execute(validation_catalog_sql)
+			catalog = ValidationCatalog(cursor.fetchall())
+		with cache_lock: 
+			# Do not keep a catalog read while a new load was committed
+			if cached_data_version == catalog_version: 
+				validation_catalog = catalog
+	return catalog
 
 # **** HELPER QUERY FUNCTIONS ****
 
+# These are served from the validation catalog. The SQL of each one is kept for 
+# AsyncDatabase.py, which runs it directly.
+
+year_range_for_leading_cause_of_death_sql = "SELECT MIN(year), MAX(year) FROM LeadingCauseOfDeath"
+
 def getYearRangeForLeadingCauseOfDeath():
 	'''
 		Function to find the minimum and maximum years present in the 
 		LeadingCauseOfDeath table so that the user can be given a range
 		of years to pick from. 
 	'''
-	query_string = "SELECT MAX(year) FROM LeadingCauseOfDeath"
-	cursor.execute(query_string)
-	max_year = cursor.fetchall()[0][0]
-
-	query_string = "SELECT MIN(year) FROM LeadingCauseOfDeath"
-	cursor.execute(query_string)
-	min_year = cursor.fetchall()[0][0]
+	return getValidationCatalog().year_ranges['LeadingCauseOfDeath']
 
-	return (min_year, max_year)
+year_range_for_nutrition_sql = "SELECT MIN(yearstart), MAX(yearstart) FROM Nutrition"
 
 def getYearRangeForNutrition(): 
 	'''
@@ -37,42 +865,36 @@ def getYearRangeForNutrition():
 		Nutrition table so that the user can be given a range of years 
 		to pick from.
 	'''
-	query_string = "SELECT MAX(yearstart) FROM Nutrition"
-	cursor.execute(query_string)
-	max_year = cursor.fetchall()[0][0]
-
-	query_string = "SELECT MIN(yearstart) FROM Nutrition"
-	cursor.execute(query_string)
-	min_year = cursor.fetchall()[0][0]
+	return getValidationCatalog().year_ranges['Nutrition']
 
-	return (min_year, max_year)
+nutrition_states_sql = "SELECT DISTINCT locationdesc FROM Nutrition NATURAL JOIN location"
 
 def getNutritionStates(): 
 	'''
 		Function to get the states in the Nutrition table to 
 		check for valid user input. 
 	'''
-	query_string = "SELECT DISTINCT locationdesc FROM Nutrition NATURAL JOIN location"
-	cursor.execute(query_string)
-	return cursor.fetchall()
+	return [[state] for state in getValidationCatalog().states['Nutrition']]
+
+topics_for_nutrition_sql = "SELECT DISTINCT topicid, topic FROM Nutrition NATURAL JOIN TopicInformation"
 
 def getTopicsForNutrition(): 
 	'''
 		Function to return the available topics in the 
 		Nutrition dataset.
 	'''
-	query_string = "SELECT DISTINCT topicid, topic FROM Nutrition NATURAL JOIN TopicInformation"
-	cursor.execute(query_string)
-	return cursor.fetchall()
+	return [list(topic) for topic in getValidationCatalog().topics['Nutrition']]
+
+nutrition_questions_for_topic_id_sql = "SELECT DISTINCT question, questionid FROM Nutrition NATURAL JOIN questioninformation WHERE topicid = %s"
 
 def getNutritionQuestionsForTopicID(topicid):
 	'''
 		Function that gets all the questions associated with a topicId 
 		for the Nutrition table.
 	'''
-	query_string = "SELECT DISTINCT question, questionid FROM Nutrition NATURAL JOIN questioninformation WHERE topicid = %s"
-	cursor.execute(query_string, (topicid,))
-	return cursor.fetchall()
+	return [list(question) for question in getValidationCatalog().questions.get(('Nutrition', topicid), [])]
+
+year_start_year_end_ranges_cdi_sql = "SELECT MIN(yearstart), MAX(yearstart), MIN(yearend), MAX(yearend) FROM ChronicDiseaseIndicator"
 
 def getYearStartYearEndRangesCDI(): 
 	'''
@@ -80,82 +902,82 @@ def getYearStartYearEndRangesCDI():
 		CDI table so that the user can pick a valid start year and end 
 		year. 
 	'''
-	query_string = "SELECT MAX(yearstart) FROM ChronicDiseaseIndicator"
-	cursor.execute(query_string)
-	max_year_start = cursor.fetchall()[0][0]
+	return getValidationCatalog().year_ranges['ChronicDiseaseIndicator']
 
-	query_string = "SELECT MIN(yearstart) FROM ChronicDiseaseIndicator"
-	cursor.execute(query_string)
-	min_year_start = cursor.fetchall()[0][0]
-
-	query_string = "SELECT MAX(yearend) FROM ChronicDiseaseIndicator"
-	cursor.execute(query_string)
-	max_year_end = cursor.fetchall()[0][0]
-
-	query_string = "SELECT MIN(yearend) FROM ChronicDiseaseIndicator"
-	cursor.execute(query_string)
-	min_year_end = cursor.fetchall()[0][0]
-
-	return (min_year_start, max_year_start, min_year_end, max_year_end)
+cdi_states_sql = "SELECT DISTINCT locationdesc FROM ChronicDiseaseIndicator NATURAL JOIN location"
 
 def getCDIStates(): 
 	'''
 		Function to get the states in the CDI table to 
 		check for valid user input. 
 	'''
-	query_string = "SELECT DISTINCT locationdesc FROM ChronicDiseaseIndicator NATURAL JOIN location"
-	cursor.execute(query_string)
-	return cursor.fetchall()
+	return [[state] for state in getValidationCatalog().states['ChronicDiseaseIndicator']]
+
+topics_for_cdi_sql = "SELECT DISTINCT topicid, topic FROM ChronicDiseaseIndicator NATURAL JOIN TopicInformation"
 
 def getTopicsForCDI(): 
 	'''
 		Function to return the available topics in the 
 		CDI dataset. 
 	'''
-	query_string = "SELECT DISTINCT topicid, topic FROM ChronicDiseaseIndicator NATURAL JOIN TopicInformation"
-	cursor.execute(query_string)
-	return cursor.fetchall()
+	return [list(topic) for topic in getValidationCatalog().topics['ChronicDiseaseIndicator']]
+
+cdi_questions_for_topic_id_sql = "SELECT DISTINCT question, questionid FROM ChronicDiseaseIndicator NATURAL JOIN questioninformation WHERE topicid = %s"
 
 def getCDIQuestionsForTopicID(topicid): 
 	'''
 		Function that gets all the questions associated with a topicId 
 		for the ChronicDiseaseIndicator table.
 	'''
-	query_string = "SELECT DISTINCT question, questionid FROM ChronicDiseaseIndicator NATURAL JOIN questioninformation WHERE topicid = %s"
-	cursor.execute(query_string, (topicid,))
-	return cursor.fetchall()
+	return [list(question) for question in getValidationCatalog().questions.get(('ChronicDiseaseIndicator', topicid), [])]
 
 def getDrugPoisoningYears(): 
 	'''
 		Function to get the valid year range for the drug poisoning 
 		data. (Stored in an XML file).
 	'''
-	min_year = 9999 
-	max_year = 0
-	for year in tree.xpath('/DrugPoisoning/DrugPoisoningStatistic/Year'):
-		year_int = int(year.text)
-		if year_int < min_year: 
-			min_year = year_int
-		if year_int > max_year: 
-			max_year = year_int
-	return (min_year, max_year)	
+	if drug_poisoning_settings['low_memory']: 
+		return streamDrugPoisoningYears(xml_file)
+	return getDrugPoisoningData().yearRange()
 
 def getDrugPoisoningStates(): 
 	'''
 		Function to get the valid state for the drug poisoning 
 		data. (Stored in an XML file).
 	'''
-	state_list = []
-	for state in tree.xpath('/DrugPoisoning/DrugPoisoningStatistic/State'): 
-		if state.text not in state_list: 
-			state_list.append(state.text)
-	return state_list
+	if drug_poisoning_settings['low_memory']: 
+		return streamDrugPoisoningStates(xml_file)
+	return list(getDrugPoisoningData().state_names)
 
 
 
 
 # **** MAIN QUERY FUNCTIONS ****
 
+# Each state's leading cause of death (other than 'All causes') for every year, 
+# ranked in a single pass over LeadingCauseOfDeath. RANK keeps ties, so a state 
+# with two causes with the same (highest) number of deaths gets both. A filter 
+# on year outside of this subquery is pushed down into it by PostgreSQL.
+top_cause_of_death_sql = """
+					SELECT year, state, causename, deaths
+					FROM 
+					(
+						SELECT year, state, causename, deaths, 
+							RANK() OVER (PARTITION BY state, year ORDER BY deaths DESC) AS death_rank
+						FROM LeadingCauseOfDeath
+						WHERE causename != 'All causes'
+					) AS ranked
+					WHERE death_rank = 1
+					"""
+
+query_one_sql = """
+					SELECT year as Year, state as State, causename as MaxCauseOfDeath, deaths as NumberOfDeaths
+					FROM ({}) AS top_cause
+					WHERE year = %s
+					ORDER BY state ASC;
+					""".format(top_cause_of_death_sql)
+
+@cachedQuery
 def queryOne(year): 
 	'''
 		Function to run the first query option. 
@@ -166,51 +988,47 @@ def queryOne(year):
 		The query returns the cause of death that caused the most 
 		deaths for each state during a given year. 
 	'''
-	query_string = """
+	with getCursor() as cursor: 
+		cursor.execute(query_one_sql, (year,))
+		records = cursor.fetchall()
+		return records
+
+query_one_all_years_sql = """
 					SELECT year as Year, state as State, causename as MaxCauseOfDeath, deaths as NumberOfDeaths
-					FROM LeadingCauseOfDeath
-					NATURAL JOIN 
-					(
-						SELECT state, MAX(deaths) AS max_deaths 
-						FROM LeadingCauseOfDeath
-						WHERE causename != 'All causes' and year = %s
-						GROUP BY (state, year)
-					) AS foo
-					WHERE year = %s and deaths = max_deaths and state = foo.state
-					ORDER BY state ASC;
-					"""
-	cursor.execute(query_string, (year, year))
-	records = cursor.fetchall()
-	return records
+					FROM ({}) AS top_cause
+					ORDER BY year ASC, state ASC;
+					""".format(top_cause_of_death_sql)
 
-def queryTwo(year): 
+@cachedQuery
+def queryOneAllYears(): 
 	'''
-		Function to run the second query option. 
-		Input: year
+		Function to run the first query option for every year at once. 
 		Output: The results of running the query in the 
-		form of a list of rows(lists).
+		form of a list of rows(lists), ordered by year and state.
 
-		The query gets the States and percent of people with no physical activity for states where
-		30% of the population is considered overweight.
+		The query returns the cause of death that caused the most 
+		deaths for each state during each year, with a single scan of 
+		the LeadingCauseOfDeath table. 
 	'''
-	query_string = """
+	with getCursor() as cursor: 
+		cursor.execute(query_one_all_years_sql)
+		records = cursor.fetchall()
+		return records
+
+query_two_sql = """
 						SELECT yearstart, locationdesc, overweight_value, activity_value
 						FROM 
 						(
 							(
-								SELECT yearstart, locationid, ROUND(100*(SUM(samplesize * datavalue/100) / SUM(samplesize)),3) AS activity_value
-								FROM Nutrition 
-								WHERE QuestionID = 'Q047' AND yearstart = %s AND yearend = %s and samplesize > 0
-								GROUP BY (locationid, yearstart, QuestionID)
-								ORDER BY locationid ASC
+								SELECT yearstart, locationid, weightedvalue AS activity_value
+								FROM NutritionWeightedValue 
+								WHERE QuestionID = 'Q047' AND yearstart = %s AND yearend = %s
 							) AS queryone
 							NATURAL JOIN 
 							(
-								SELECT yearstart, locationid, ROUND(100*(SUM(samplesize * datavalue/100) / SUM(samplesize)),3) AS overweight_value
-								FROM Nutrition 
-								WHERE QuestionID = 'Q037' AND yearstart = %s AND yearend = %s and samplesize > 0
-								GROUP BY (locationid, yearstart, QuestionID)
-								ORDER BY locationid ASC
+								SELECT yearstart, locationid, weightedvalue AS overweight_value
+								FROM NutritionWeightedValue 
+								WHERE QuestionID = 'Q037' AND yearstart = %s AND yearend = %s
 							) AS querythree
 						) AS queryfour
 						NATURAL JOIN 
@@ -220,45 +1038,39 @@ def queryTwo(year):
 						) AS querytwo
 						WHERE queryfour.locationid = querytwo.locationid AND overweight_value > 35;
 				   """
-	cursor.execute(query_string, (year, year, year, year))
-	records = cursor.fetchall()
-	return records
 
-def queryThree(year): 
+@cachedQuery
+def queryTwo(year): 
 	'''
-		Function to run the third query option. 
+		Function to run the second query option. 
 		Input: year
 		Output: The results of running the query in the 
 		form of a list of rows(lists).
 
-		The query gets the percent of people with no physical activity for states 
-		where heart disease is the leading cause of death for a given year.
+		The query gets the States and percent of people with no physical activity for states where
+		30% of the population is considered overweight.
 	'''
-	query_string = """
+	with getCursor() as cursor: 
+		cursor.execute(query_two_sql, (year, year, year, year))
+		records = cursor.fetchall()
+		return records
+
+query_three_sql = """
 						SELECT Year, State, MaxCauseOfDeath, no_activity_perc
 						FROM
 						(
 							SELECT year as Year, state as State, causename as MaxCauseOfDeath
-							FROM LeadingCauseOfDeath
-							NATURAL JOIN 
-							(
-								SELECT state, MAX(deaths) AS max_deaths 
-								FROM LeadingCauseOfDeath
-								WHERE causename != 'All causes' and year = %s
-								GROUP BY (state, year)
-							) AS subquery
-							WHERE year = %s and deaths = max_deaths and state = subquery.state and causename = 'Heart disease'
+							FROM ({}) AS top_cause
+							WHERE year = %s and causename = 'Heart disease'
 						) as MainQueryOne
 						NATURAL JOIN 
 						(
 							SELECT yearstart AS Year, locationdesc AS State, no_activity_perc
 							FROM
 							(
-								SELECT yearstart, locationid, ROUND(100*(SUM(samplesize * datavalue/100) / SUM(samplesize)),3) AS no_activity_perc
-								FROM Nutrition 
-								WHERE QuestionID = 'Q047' AND yearstart = %s AND yearend = %s and samplesize > 0
-								GROUP BY (locationid, yearstart, QuestionID)
-								ORDER BY locationid ASC
+								SELECT yearstart, locationid, weightedvalue AS no_activity_perc
+								FROM NutritionWeightedValue 
+								WHERE QuestionID = 'Q047' AND yearstart = %s AND yearend = %s
 							) AS subqueryone
 							NATURAL JOIN 
 							(
@@ -266,67 +1078,73 @@ def queryThree(year):
 								FROM location
 							) AS subquerytwo
 						) AS MainQueryTwo;
-				   """
-	cursor.execute(query_string, (year, year, year, year))
-	records = cursor.fetchall()
-	return records
+				   """.format(top_cause_of_death_sql)
 
-def queryFour(yearstart, yearend, state, questionid): 
+@cachedQuery
+def queryThree(year): 
 	'''
-		Function to run the fourth query option. 
-		Input: yearstate, yearend, state, questionId
+		Function to run the third query option. 
+		Input: year
 		Output: The results of running the query in the 
 		form of a list of rows(lists).
 
-		The query provides the statistics from the CDI data for each 
-		stratification for a given question, state, and year range.
+		The query gets the percent of people with no physical activity for states 
+		where heart disease is the leading cause of death for a given year.
 	'''
-	query_string = """
+	with getCursor() as cursor: 
+		cursor.execute(query_three_sql, (year, year, year))
+		records = cursor.fetchall()
+		return records
+
+query_four_sql = """
 						SELECT DISTINCT StratificationCategory1, Stratification1, DataValueUnit, DataValueType, DataValue
 						FROM  ChronicDiseaseIndicator NATURAL JOIN StratificationInformation NATURAL JOIN DataValueTypeInformation NATURAL JOIN Location
 						WHERE YearStart = %s and YearEnd = %s and LocationDesc = %s and questionID = %s and datavalue != '-1';
 				   """
-	cursor.execute(query_string, (yearstart, yearend, state, questionid))
-	return cursor.fetchall()
 
-def queryFive(year, state, questionid): 
+def queryFour(yearstart, yearend, state, questionid): 
 	'''
-		Function to run the fifth query option. 
-		Input: year, state, questionId
+		Function to run the fourth query option. 
+		Input: yearstate, yearend, state, questionId
 		Output: The results of running the query in the 
 		form of a list of rows(lists).
 
-		The query provides the statistics from the Nutrition data for each 
+		The query provides the statistics from the CDI data for each 
 		stratification for a given question, state, and year range.
 	'''
-	query_string = """
+	with getCursor() as cursor: 
+		cursor.execute(query_four_sql, (yearstart, yearend, state, questionid))
+		return cursor.fetchall()
+
+query_five_sql = """
 						SELECT DISTINCT StratificationCategory1, Stratification1, DataValueUnit, DataValueType, DataValue
 						FROM  Nutrition NATURAL JOIN StratificationInformation NATURAL JOIN DataValueTypeInformation NATURAL JOIN Location
 						WHERE YearStart = %s and LocationDesc = %s and questionID = %s and datavalue > -1;
 				   """
-	cursor.execute(query_string, (year, state, questionid))
-	return cursor.fetchall()
 
-def querySix(year): 
+def queryFive(year, state, questionid): 
 	'''
-		Function to run the sixth query option. 
-		Input: year
+		Function to run the fifth query option. 
+		Input: year, state, questionId
 		Output: The results of running the query in the 
 		form of a list of rows(lists).
 
-		The query returns the states where more than 30% of people get 
-		no exercise, along with the leading cause of death statistics for 
-		those states (for a given year).
+		The query provides the statistics from the Nutrition data for each 
+		stratification for a given question, state, and year range.
 	'''
-	query_string = """
+	with getCursor() as cursor: 
+		cursor.execute(query_five_sql, (year, state, questionid))
+		return cursor.fetchall()
+
+query_six_sql = """
 						SELECT * FROM 
 						(
 							SELECT yearstart AS Year, locationdesc AS State, no_activity_perc
 							FROM
 							(
-								SELECT yearstart, locationdesc, ROUND(100*(SUM(samplesize * datavalue/100) / SUM(samplesize)),3) AS no_activity_perc
-								FROM Nutrition NATURAL JOIN location
-								WHERE QuestionID = 'Q047' AND yearstart = %s AND yearend = %s and samplesize > 0
+								SELECT yearstart, locationdesc, ROUND(100*(SUM(weightedsum) / SUM(samplesizesum)),3) AS no_activity_perc
+								FROM NutritionWeightedValue NATURAL JOIN location
+								WHERE QuestionID = 'Q047' AND yearstart = %s AND yearend = %s
 								GROUP BY (locationdesc, yearstart, QuestionID)
 								ORDER BY locationdesc ASC
 							) AS subqueryone
@@ -341,10 +1159,25 @@ def querySix(year):
 						ORDER BY (State, CauseNameExpanded);
 				   """
 
-	cursor.execute(query_string, (year, year, year))
-	records = cursor.fetchall()
-	return records
+@cachedQuery
+def querySix(year): 
+	'''
+		Function to run the sixth query option. 
+		Input: year
+		Output: The results of running the query in the 
+		form of a list of rows(lists).
 
+		The query returns the states where more than 30% of people get 
+		no exercise, along with the leading cause of death statistics for 
+		those states (for a given year).
+	'''
+
+	with getCursor() as cursor: 
+		cursor.execute(query_six_sql, (year, year, year))
+		records = cursor.fetchall()
+		return records
+
+@cachedQuery(version=getDrugPoisoningFileVersion, key=lambda user_year, user_state: (int(user_year), user_state.lower()))
 def querySeven(user_year, user_state): 
 	'''
 		Function to run the seventh query option. 
@@ -355,29 +1188,82 @@ def querySeven(user_year, user_state):
 		The query returns drug poisioning statistics for 
 		a user provided year and state. 
 	'''
-	
-	#List of rows(lists)
-	results = []
-	row = []
-
-	for stat in tree.xpath('/DrugPoisoning/DrugPoisoningStatistic'): 
-		year = stat.find('Year').text
-		state = stat.find('State').text
-
-		if int(year) == int(user_year) and state.lower() == user_state.lower(): 
-			upper_age = stat.find('AgeRange').find('UpperBound').text
-			lower_age = stat.find('AgeRange').find('LowerBound').text
-			sex = stat.find('Sex').text
-			Race = stat.find('Race').text
-			deaths = stat.find('Deaths').text
-			population = stat.find('Population').text
-			row = []
-			row.append(sex)
-			row.append(Race)
-			row.append("{}-{}".format(lower_age, upper_age))
-			row.append(deaths)
-			row.append(population)
-			row.append(round(int(deaths)*100/int(population), 8))
-			results.append(row)
-	return results
+	if drug_poisoning_settings['low_memory']: 
+		return streamRowsForYearAndState(xml_file, user_year, user_state)
+	return getDrugPoisoningData().rowsForYearAndState(user_year, user_state)
+
+def queryDrugPoisoning(year_start=None, year_end=None, states=None, sexes=None, races=None, age_ranges=None, group_by=('year',)): 
+	'''
+		Function to sum up the drug poisoning statistics over a range of 
+		years (and optionally only for some states, sexes, races and age 
+		ranges), grouped by any of 'year', 'state', 'sex', 'race' and 'age'. 
+		Output: list of rows of the group_by values, deaths, population, 
+		and deaths as a % of the population. 
+		See DrugPoisoningData.aggregate.
+	'''
+	return getDrugPoisoningData().aggregate(year_start, year_end, states, sexes, races, age_ranges, tuple(group_by))
+
+
+# **** STREAMING QUERY FUNCTIONS ****
+
+# Generator versions of the main query functions for results that are too 
+# big to hold in memory: the rows are read from a server-side cursor, 
+# stream_itersize rows at a time, and yielded one by one as plain tuples. 
+# The connection goes back to the pool once the generator is exhausted or 
+# closed, so a caller that stops early should close it (or use 
+# contextlib.closing). These are not cached.
+stream_itersize = 2000
+
+def streamQuery(query_string, parameters=(), itersize=None): 
+	'''
+		Function to run a query on a server-side cursor and yield its 
+		rows as tuples, fetching itersize (stream_itersize by default) 
+		rows from the server at a time.
+	'''
+	with getCursor(name="streaming_query", cursor_factory=None) as cursor: 
+		cursor.itersize = itersize or stream_itersize
+		cursor.execute(query_string, parameters)
+		for row in cursor: 
+			yield row
+
+def streamQueryOne(year, itersize=None): 
+	'''
+		Streaming version of queryOne.
+	'''
+	return streamQuery(query_one_sql, (year,), itersize)
+
+def streamQueryOneAllYears(itersize=None): 
+	'''
+		Streaming version of queryOneAllYears.
+	'''
+	return streamQuery(query_one_all_years_sql, (), itersize)
+
+def streamQueryTwo(year, itersize=None): 
+	'''
+		Streaming version of queryTwo.
+	'''
+	return streamQuery(query_two_sql, (year, year, year, year), itersize)
 
+def streamQueryThree(year, itersize=None): 
+	'''
+		Streaming version of queryThree.
+	'''
+	return streamQuery(query_three_sql, (year, year, year), itersize)
+
+def streamQueryFour(yearstart, yearend, state, questionid, itersize=None): 
+	'''
+		Streaming version of queryFour.
+	'''
+	return streamQuery(query_four_sql, (yearstart, yearend, state, questionid), itersize)
+
+def streamQueryFive(year, state, questionid, itersize=None): 
+	'''
+		Streaming version of queryFive.
+	'''
+	return streamQuery(query_five_sql, (year, state, questionid), itersize)
+
+def streamQuerySix(year, itersize=None): 
+	'''
+		Streaming version of querySix.
+	'''
+	return streamQuery(query_six_sql, (year, year, year), itersize)
@@ -0,0 +1,329 @@
+import argparse
+import collections
+import csv
+import decimal
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+import Application
+import Database
+
+try:
+	import pyarrow
+	import pyarrow.parquet
+except ImportError:
+	# pyarrow is only needed for --format parquet
+	pyarrow = None
+
+
+# ***************** QUERIES *****************
+
+# The Database.py function of each query, and the names of its parameters
+queries = {
+	1: (Database.queryOne, ('year',)),
+	2: (Database.queryTwo, ('year',)),
+	3: (Database.queryThree, ('year',)),
+	4: (Database.queryFour, ('yearstart', 'yearend', 'state', 'questionid')),
+	5: (Database.queryFive, ('year', 'state', 'questionid')),
+	6: (Database.querySix, ('year',)),
+	7: (Database.querySeven, ('year', 'state'))
+}
+
+integer_parameters = {'year', 'yearstart', 'yearend'}
+
+def yearsInRange(year_range):
+	'''
+	Function to list every year of a (min year, max year) range.
+	'''
+	return list(range(year_range[0], year_range[1] + 1))
+
+def commonYears():
+	'''
+	Function to list the years with both nutrition and leading cause of
+	death data (the years that queries 3 and 6 can be run for).
+	'''
+	year_range_nutrition = Database.getYearRangeForNutrition()
+	year_range_lcd = Database.getYearRangeForLeadingCauseOfDeath()
+	return yearsInRange((max(year_range_nutrition[0], year_range_lcd[0]), min(year_range_nutrition[1], year_range_lcd[1])))
+
+def existingCombinations(query_string):
+	'''
+	Function to list the distinct rows of a query, as sorted tuples.
+	'''
+	with Database.getCursor() as cursor:
+		cursor.execute(query_string)
+		return sorted(tuple(row) for row in cursor.fetchall())
+
+# Functions that list every valid value of each parameter of each query (for 'all')
+parameter_values = {
+	1: {'year': lambda: yearsInRange(Database.getYearRangeForLeadingCauseOfDeath())},
+	2: {'year': lambda: yearsInRange(Database.getYearRangeForNutrition())},
+	3: {'year': commonYears},
+	5: {'year': lambda: yearsInRange(Database.getYearRangeForNutrition())},
+	6: {'year': commonYears},
+	7: {
+		'year': lambda: yearsInRange(Database.getDrugPoisoningYears()),
+		'state': lambda: sorted(Database.getDrugPoisoningStates())
+	}
+}
+
+# Functions that list the combinations of values that parameters which go together
+# take in the data (for 'all'), rather than every combination of their values: most
+# of those (e.g. a year end before the year start) would return nothing
+parameter_combinations = {
+	4: {
+		('yearstart', 'yearend'): lambda: existingCombinations("""SELECT DISTINCT YearStart, YearEnd
+			FROM ChronicDiseaseIndicator WHERE DataValue != '-1'"""),
+		('state', 'questionid'): lambda: existingCombinations("""SELECT DISTINCT LocationDesc, QuestionID
+			FROM (SELECT DISTINCT LocationID, QuestionID FROM ChronicDiseaseIndicator WHERE DataValue != '-1') AS combinations
+			NATURAL JOIN Location""")
+	},
+	5: {
+		('state', 'questionid'): lambda: existingCombinations("""SELECT DISTINCT LocationDesc, QuestionID
+			FROM (SELECT DISTINCT LocationID, QuestionID FROM Nutrition WHERE DataValue > -1) AS combinations
+			NATURAL JOIN Location""")
+	}
+}
+
+
+# ***************** PARAMETER SETS *****************
+
+def parseParameterValue(name, value):
+	'''
+	Function to convert a parameter value given as a string to the
+	type the query expects.
+	'''
+	value = value.strip()
+	if name in integer_parameters:
+		if not value.isdigit():
+			raise SystemExit("'{}' is not a valid value for {}".format(value, name))
+		return int(value)
+	return value
+
+def parameterSetsFromOptions(query, parameter_options):
+	'''
+	Function to build the parameter sets of a query from --param options
+	(name=value1,value2,... or name=all). Every parameter that is not
+	given takes all of its values, and parameters that go together (see
+	parameter_combinations) only take the combinations in the data that
+	match the values given. Returns every combination of the values, as
+	tuples in the order of the query's parameters.
+	'''
+	parameter_names = queries[query][1]
+	given_values = dict()
+	for option in parameter_options:
+		name, separator, values = option.partition('=')
+		name = name.strip().lower()
+		if not separator or name not in parameter_names:
+			raise SystemExit("Query {} has no parameter '{}' (its parameters are: {})".format(query, name, ", ".join(parameter_names)))
+		if values.strip().lower() != 'all':
+			given_values[name] = [parseParameterValue(name, value) for value in values.split(',')]
+
+	# The values of each group of parameters, as tuples
+	groups = list(parameter_combinations.get(query, dict()).items())
+	groups += [((name,), values) for name, values in parameter_values.get(query, dict()).items()]
+	group_names = []
+	values_for_groups = []
+	for names, values in groups:
+		if all(name in given_values for name in names):
+			values_for_groups.append(list(itertools.product(*(given_values[name] for name in names))))
+		elif len(names) == 1:
+			values_for_groups.append([(value,) for value in values()])
+		else:
+			values_for_groups.append([combination for combination in values()
+				if all(value in given_values[name] for name, value in zip(names, combination) if name in given_values)])
+		group_names += names
+
+	# Put the values back in the order of the query's parameters
+	positions = [group_names.index(name) for name in parameter_names]
+	return (tuple(sum(values, ())[position] for position in positions) for values in itertools.product(*values_for_groups))
+
+def parameterSetsFromFile(query, parameters_filename):
+	'''
+	Function to read the parameter sets of a query from a CSV file, with
+	a header line naming the query's parameters and one set per line.
+	'''
+	parameter_names = queries[query][1]
+	with open(parameters_filename, newline='', encoding='utf-8') as parameters_file:
+		parameters_reader = csv.DictReader(parameters_file)
+		header = [name.strip().lower() for name in parameters_reader.fieldnames or []]
+		if sorted(header) != sorted(parameter_names):
+			raise SystemExit("The header of {} should name the parameters of query {}: {}".format(parameters_filename, query, ", ".join(parameter_names)))
+		parameters_reader.fieldnames = header
+		for row in parameters_reader:
+			yield tuple(parseParameterValue(name, row[name]) for name in parameter_names)
+
+
+# ***************** OUTPUT FORMATS *****************
+
+class CsvResultWriter:
+	'''
+	Writes the result rows as CSV, with a header line.
+	'''
+	def __init__(self, output, columns):
+		self.writer = csv.writer(output)
+		self.writer.writerow(columns)
+
+	def writeRows(self, rows):
+		self.writer.writerows(rows)
+
+	def close(self):
+		pass
+
+class JsonLinesResultWriter:
+	'''
+	Writes each result row as a JSON object on its own line.
+	Numeric (Decimal) values are written as JSON numbers.
+	'''
+	def __init__(self, output, columns):
+		self.output = output
+		self.columns = columns
+
+	def writeRows(self, rows):
+		self.output.write("".join(json.dumps(dict(zip(self.columns, row)), default=float) + "\n" for row in rows))
+
+	def close(self):
+		pass
+
+class ParquetResultWriter:
+	'''
+	Writes the result rows to a Parquet file, one row group per
+	row_group_size rows. The column types are taken from the first row
+	group (columns with no values in it are written as strings), and
+	Decimal values are written as doubles.
+	'''
+	row_group_size = 65536
+
+	def __init__(self, output, columns):
+		if pyarrow is None:
+			raise SystemExit("Writing Parquet files needs pyarrow (pip install pyarrow)")
+		self.output = output
+		self.columns = columns
+		self.writer = None
+		self.pending_rows = []
+
+	def writeRows(self, rows):
+		self.pending_rows.extend([float(value) if isinstance(value, decimal.Decimal) else value for value in row] for row in rows)
+		if len(self.pending_rows) >= self.row_group_size:
+			self.flush()
+
+	def flush(self):
+		columns = list(zip(*self.pending_rows)) or [()]*len(self.columns)
+		if self.writer is None:
+			table = pyarrow.table([pyarrow.array(column) for column in columns], names=self.columns)
+			schema = pyarrow.schema([pyarrow.field(field.name, pyarrow.string()) if pyarrow.types.is_null(field.type) else field for field in table.schema])
+			self.writer = pyarrow.parquet.ParquetWriter(self.output, schema)
+		table = pyarrow.table([pyarrow.array(column, type=field.type) for column, field in zip(columns, self.writer.schema)], schema=self.writer.schema)
+		self.writer.write_table(table)
+		self.pending_rows = []
+
+	def close(self):
+		if self.pending_rows or self.writer is None:
+			self.flush()
+		self.writer.close()
+
+result_writers = {
+	'csv': CsvResultWriter,
+	'jsonl': JsonLinesResultWriter,
+	'parquet': ParquetResultWriter
+}
+
+
+# ***************** RUN THE QUERIES *****************
+
+def runQuery(query, parameter_set):
+	'''
+	Function to run a query for one parameter set. Returns the result
+	rows, each one starting with the parameter values.
+	'''
+	query_function = queries[query][0]
+	results = query_function(*parameter_set)
+	if query == 7:
+		# Sorted the same way as in Application.py
+		results = sorted(results, key = lambda x: (x[0], x[1], x[2]))
+	return [list(parameter_set) + list(result) for result in results]
+
+def runParameterSets(query, parameter_sets, result_writer, workers):
+	'''
+	Function to run a query for every parameter set, with up to workers
+	queries running at the same time, and to write the results in the
+	order of the parameter sets. Only a few parameter sets per worker are
+	queued at a time, so the results are written as they come in rather
+	than collected first. A parameter set that fails is reported and
+	skipped. Returns the number of result rows and of failed sets.
+	'''
+	number_of_rows = 0
+	failed = 0
+	with ThreadPoolExecutor(max_workers=workers) as executor:
+		running = collections.deque()
+		parameter_sets = iter(parameter_sets)
+		while True:
+			for parameter_set in itertools.islice(parameter_sets, 2*workers - len(running)):
+				running.append((parameter_set, executor.submit(runQuery, query, parameter_set)))
+			if not running:
+				break
+			parameter_set, result = running.popleft()
+			try:
+				rows = result.result()
+			except psycopg2.Error as error:
+				print("Query {} failed for {}: {}".format(query, parameter_set, str(error).strip()), file=sys.stderr)
+				failed += 1
+				continue
+			result_writer.writeRows(rows)
+			number_of_rows += len(rows)
+	return number_of_rows, failed
+
+
+# ***************** MAIN PROGRAM *****************
+if __name__ == "__main__":
+	arg_parser = argparse.ArgumentParser(description="Run one of the Application.py queries for many parameter sets and export the results.")
+	arg_parser.add_argument("query", type=int, choices=sorted(queries), help="number of the query (as in the Application.py menu)")
+	arg_parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUES",
+		help="values of a query parameter, separated by commas, or 'all' (the default). May be repeated; every combination is run")
+	arg_parser.add_argument("--params-file", help="CSV file with a header naming the query parameters and one parameter set per line (instead of --param)")
+	arg_parser.add_argument("--output", default="-", help="file to write the results to (default: standard output)")
+	arg_parser.add_argument("--format", choices=sorted(result_writers),
+		help="format of the results (default: from the extension of --output, or csv)")
+	arg_parser.add_argument("--workers", type=int, default=Database.pool_settings['max_connections'],
+		help="number of queries to run at the same time (default: the size of the connection pool, %(default)s)")
+	args = arg_parser.parse_args()
+
+	output_format = args.format or os.path.splitext(args.output)[1].lstrip('.').lower()
+	if output_format not in result_writers:
+		output_format = 'csv'
+	if output_format == 'parquet' and args.output == '-':
+		raise SystemExit("Parquet results need an --output file")
+
+	if args.params_file:
+		parameter_sets = parameterSetsFromFile(args.query, args.params_file)
+	else:
+		parameter_sets = parameterSetsFromOptions(args.query, args.param)
+
+	# One connection for each worker
+	if args.workers > Database.pool_settings['max_connections']:
+		Database.configurePool(max_connections=args.workers)
+
+	# The parameter values come first in each row (as param_<name>)
+	columns = ["param_" + name for name in queries[args.query][1]] + Application.query_headings[args.query]
+	if args.output == '-':
+		output = sys.stdout
+	elif output_format == 'parquet':
+		output = open(args.output, 'wb')
+	else:
+		output = open(args.output, 'w', newline='', encoding='utf-8')
+
+	try:
+		result_writer = result_writers[output_format](output, columns)
+		number_of_rows, failed = runParameterSets(args.query, parameter_sets, result_writer, args.workers)
+		result_writer.close()
+	finally:
+		if output is not sys.stdout:
+			output.close()
+		Database.closePool()
+
+	print("{} rows written{}".format(number_of_rows, ", {} parameter sets failed".format(failed) if failed else ""), file=sys.stderr)
+	if failed:
+		raise SystemExit(1)
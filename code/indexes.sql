@@ -0,0 +1,30 @@
+/* 
+	Indexes for the predicates used by the queries in Database.py. 
+	These are created by load_data.py after the data has been loaded 
+	(instead of in schema.sql), so that they do not slow down the inserts. 
+*/
+
+/**** Leading Causes of Death Data ****/
+/* Queries 1, 3 and 6 filter on year (and rank by state), which the primary key (Year, State, CauseName) 
+   already serves. An earlier version of this file created a second (Year, State) index; drop it. */
+DROP INDEX IF EXISTS LeadingCauseOfDeathYearStateIndex;
+
+/**** Chronic Disease Indicators Data ****/
+/* Query 4 filters on question, year range and location. */
+CREATE INDEX IF NOT EXISTS ChronicDiseaseIndicatorQuestionYearLocationIndex 
+	ON ChronicDiseaseIndicator(QuestionID, YearStart, YearEnd, LocationID) 
+	INCLUDE (StratificationID1, DataValueTypeID, DataValueUnit, DataValue);
+
+/* The topic and question lists used to prompt the user. */
+CREATE INDEX IF NOT EXISTS ChronicDiseaseIndicatorTopicQuestionIndex 
+	ON ChronicDiseaseIndicator(TopicID, QuestionID);
+
+/**** Nutrition Data ****/
+/* Query 5 (and the NutritionWeightedValue view) filter on question, year range and location. */
+CREATE INDEX IF NOT EXISTS NutritionQuestionYearLocationIndex 
+	ON Nutrition(QuestionID, YearStart, YearEnd, LocationID) 
+	INCLUDE (StratificationID1, DataValueTypeID, DataValueUnit, DataValue, SampleSize);
+
+/* The topic and question lists used to prompt the user. */
+CREATE INDEX IF NOT EXISTS NutritionTopicQuestionIndex 
+	ON Nutrition(TopicID, QuestionID);
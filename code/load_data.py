@@ -1,36 +1,292 @@
+import argparse
+import contextlib
 import csv
+import functools
+import hashlib
+import multiprocessing
+import os
+import re
 import psycopg2
 import psycopg2.extras
 from psycopg2 import sql
-from xml.dom import minidom
+from lxml import etree
+import Database
+
+try:
+	import pyarrow
+	import pyarrow.compute
+	import pyarrow.csv
+except ImportError:
+	# pyarrow is only needed for the --columnar option
+	pyarrow = None
 
 
 # ***************** HELPER FUNCTIONS *****************
+# The formats of the age ranges (e.g. "15-24 years", "75+ years", "Less than 15 years"),
+# as (pattern, function from the matched numbers to (lowerbound, upperbound)).
+# Anything else (e.g. "All Ages") is the full range, (0, max_age).
+max_age = 150
+age_range_formats = [
+	(re.compile(r"(\d+)\s*[-–]\s*(\d+)"), lambda lower, upper: (int(lower), int(upper))),
+	(re.compile(r"(\d+)\s*\+"), lambda lower: (int(lower), max_age)),
+	(re.compile(r"(\d+) years? and (?:over|older)", re.IGNORECASE), lambda lower: (int(lower), max_age)),
+	(re.compile(r"(?:less than|under) (\d+)", re.IGNORECASE), lambda upper: (0, int(upper))),
+]
+
+@functools.lru_cache(maxsize=None)
 def splitAge(age): 
 	'''
 	Function to take an age range (e.g. 15-24 years) and split it 
 	into an upper and lower bound. Returns a tuple formatted as: 
 	(lowerbound, upperbound)
 	NOTE: Using  150 as the max age (for phrases like "75+ years")
+	The column only has a handful of distinct values, so each one
+	is only parsed once (using the patterns in age_range_formats).
+	'''
+	for pattern, bounds in age_range_formats:
+		match = pattern.match(age.strip())
+		if match:
+			return bounds(*match.groups())
+	return (0, max_age)
+
+def nullDefault(column, default, sql_type):
+	'''
+	Function to build the SQL expression that casts a text column of a
+	staging table to sql_type, substituting default for empty or missing
+	values (the same substitutions the row-by-row loader makes in Python).
+	'''
+	return "COALESCE(NULLIF({}, ''), '{}')::{}".format(column, default, sql_type)
+
+def createStagingTable(cursor, staging_table, number_of_columns):
+	'''
+	Function to create a temporary staging table for a CSV file. The
+	staging table has one TEXT column per CSV column (named c0, c1, ...)
+	plus a lineno column that preserves the file order, so that the merge
+	step can keep the first row for duplicate keys just like ON CONFLICT
+	DO NOTHING does for the row-by-row loader. Returns the CSV columns.
+	'''
+	columns = [sql.Identifier("c{}".format(i)) for i in range(number_of_columns)]
+	cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(staging_table)))
+	cursor.execute(sql.SQL("CREATE TEMP TABLE {} (lineno BIGSERIAL PRIMARY KEY, {})").format(
+		sql.Identifier(staging_table),
+		sql.SQL(", ").join(sql.SQL("{} TEXT").format(column) for column in columns)))
+	return columns
+
+def copyToStagingTable(cursor, staging_table, csv_filename):
+	'''
+	Function to stream a CSV file into a temporary staging table (see
+	createStagingTable) with COPY FROM STDIN. Empty fields are read as
+	empty strings rather than nulls (FORCE_NOT_NULL), as the csv module
+	reads them for the row-by-row loader. Returns the number of data
+	rows copied.
+	'''
+	with open(csv_filename, encoding="utf-8") as csv_file:
+		number_of_columns = len(next(csv.reader(csv_file, delimiter=",")))
+		csv_file.seek(0)
+
+		columns = createStagingTable(cursor, staging_table, number_of_columns)
+		copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, HEADER true, FORCE_NOT_NULL ({}))").format(
+			sql.Identifier(staging_table), sql.SQL(", ").join(columns), sql.SQL(", ").join(columns))
+		cursor.copy_expert(copy_query.as_string(cursor), csv_file)
+		return cursor.rowcount
+
+def refreshSummaryViews(cursor):
+	'''
+	Function to recompute the materialized views that summarize the loaded
+	data (see schema.sql). CONCURRENTLY lets the application keep reading
+	the old contents while the new ones are computed.
+	'''
+	cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY NutritionWeightedValue")
+
+def createIndexes(cursor):
+	'''
+	Function for the post-load phase: creates the indexes in indexes.sql
+	(now that the data is loaded, so they did not slow down the inserts)
+	and updates the planner statistics of the loaded tables.
+	'''
+	cursor.execute(open("indexes.sql", "r").read())
+	for table in ("LeadingCauseOfDeath", "Nutrition", "ChronicDiseaseIndicator", "NutritionWeightedValue"):
+		cursor.execute("ANALYZE {}".format(table))
+
+def printQueryPlanReport(cursor):
+	'''
+	Function to EXPLAIN the main queries of Database.py with parameters
+	taken from the loaded data, and print which scan each one uses on
+	the large tables. A sequential scan on one of them is flagged, since
+	it means a query is not using the indexes.
+	'''
+	large_tables = ("leadingcauseofdeath", "nutrition", "chronicdiseaseindicator", "nutritionweightedvalue")
+
+	cursor.execute("SELECT MAX(year) FROM LeadingCauseOfDeath")
+	year = cursor.fetchone()[0]
+	cursor.execute("SELECT MAX(yearstart) FROM Nutrition")
+	nutrition_year = cursor.fetchone()[0]
+	cursor.execute("SELECT yearstart, yearend, locationdesc, questionid FROM ChronicDiseaseIndicator NATURAL JOIN Location LIMIT 1")
+	cdi_row = cursor.fetchone()
+	cursor.execute("SELECT yearstart, locationdesc, questionid FROM Nutrition NATURAL JOIN Location LIMIT 1")
+	nutrition_row = cursor.fetchone()
+	if year is None or nutrition_year is None or cdi_row is None or nutrition_row is None:
+		print("Query plan report skipped: there is no data")
+		return
+
+	queries = [
+		("queryOne", Database.query_one_sql, (year,)),
+		("queryTwo", Database.query_two_sql, (nutrition_year, nutrition_year, nutrition_year, nutrition_year)),
+		("queryThree", Database.query_three_sql, (year, year, year)),
+		("queryFour", Database.query_four_sql, tuple(cdi_row)),
+		("queryFive", Database.query_five_sql, tuple(nutrition_row)),
+		("querySix", Database.query_six_sql, (year, year, year))
+	]
+
+	print("Query plans:")
+	for name, query_string, parameters in queries:
+		cursor.execute("EXPLAIN (FORMAT JSON) " + query_string, parameters)
+		plans = [cursor.fetchone()[0][0]["Plan"]]
+		scans = []
+		while plans:
+			plan = plans.pop()
+			plans.extend(plan.get("Plans", []))
+			if plan.get("Relation Name") in large_tables:
+				# a bitmap heap scan names its indexes in its Bitmap Index Scan children
+				index = plan.get("Index Name") or ", ".join(child["Index Name"] for child in plan.get("Plans", []) if "Index Name" in child)
+				scans.append((plan["Node Type"], plan["Relation Name"], index))
+
+		for node_type, relation, index in scans:
+			warning = "  <-- SEQUENTIAL SCAN" if node_type == "Seq Scan" else ""
+			print("\t{}: {} on {}{}{}".format(name, node_type, relation, " using " + index if index else "", warning))
+
+def bumpDataVersion(cursor):
+	'''
+	Function to increment the version in the DataVersion table, which
+	tells Database.py that its cached query results are out of date.
+	'''
+	cursor.execute("""INSERT INTO DataVersion(Id, Version, LoadedAt) VALUES (TRUE, 1, now())
+					ON CONFLICT (Id) DO UPDATE SET Version = DataVersion.Version + 1, LoadedAt = now()""")
+
+def getCheckpoint(cursor, csv_filename):
 	'''
-	upperbound = 150
-	lowerbound = 0 
+	Function to get the number of data rows of a CSV file that an
+	interrupted load has already committed (0 if there is no checkpoint,
+	or if the file has changed since the checkpoint was saved).
+	'''
+	file_stat = os.stat(csv_filename)
+	cursor.execute("SELECT RowNumber, FileSize, FileModified FROM LoadCheckpoint WHERE FileName = %s", (csv_filename,))
+	checkpoint = cursor.fetchone()
+	if checkpoint is None or (checkpoint[1], checkpoint[2]) != (file_stat.st_size, file_stat.st_mtime_ns):
+		return 0
+	return checkpoint[0]
+
+def saveCheckpoint(cursor, csv_filename, row_number):
+	'''
+	Function to record that the first row_number data rows of a CSV file
+	are loaded, and commit them together with the checkpoint.
+	'''
+	file_stat = os.stat(csv_filename)
+	cursor.execute("""INSERT INTO LoadCheckpoint(FileName, FileSize, FileModified, RowNumber, UpdatedAt)
+					VALUES (%s, %s, %s, %s, now())
+					ON CONFLICT (FileName) DO UPDATE SET FileSize = EXCLUDED.FileSize, FileModified = EXCLUDED.FileModified,
+					RowNumber = EXCLUDED.RowNumber, UpdatedAt = EXCLUDED.UpdatedAt""",
+					(csv_filename, file_stat.st_size, file_stat.st_mtime_ns, row_number))
+	cursor.connection.commit()
+
+def clearCheckpoints(cursor):
+	'''
+	Function to delete the checkpoints once a load has finished, so the
+	next load starts from the beginning of every file.
+	'''
+	cursor.execute("DELETE FROM LoadCheckpoint")
+	cursor.connection.commit()
+
+def insertBatch(cursor, dimension_cache, insert_query, batch):
+	'''
+	Function to insert a batch of rows with a single statement. The new
+	lookup table rows collected by dimension_cache are written first so
+	that the foreign keys of the batch are satisfied.
+	'''
+	dimension_cache.flush(cursor)
+	if batch:
+		psycopg2.extras.execute_values(cursor, insert_query, batch, page_size=batch_size)
 
-	# Case where two numbers are separated by a dash (15-24)
-	if age[0].isdigit() and age[1].isdigit() and age[2] == '-':
-		lowerbound = int(age[0] + age[1])
-		upperbound = int(age[3] + age[4])
-	# Case where one number is followed by a plus size (65+)
-	if age[0].isdigit() and age[1].isdigit() and age[2] == '+':
-		lowerbound = int(age[0] + age[1])
-	# Case where a number is preceeded by "less than" (Less than 15)
-	if age[:9] == "Less than": 
-		if age[10].isdigit() and age[11].isdigit(): 
-			upperbound = int(age[10] + age[11])
-		elif age[10]: 
-			upperbound = int(age[10])
 
-	return (lowerbound, upperbound)
+# ***************** COLUMNAR CSV READER *****************
+# Size (in bytes) of the chunks of a CSV file that are parsed at a time
+columnar_block_size = 16 << 20
+
+def readColumnarChunks(csv_filename, null_value):
+	'''
+	Function to read a CSV file with pyarrow, one chunk of about
+	columnar_block_size bytes at a time, instead of one row at a time with
+	the csv module. Yields each chunk as a pyarrow record batch with one
+	string column per CSV column, in which the empty fields are replaced
+	by null_value a whole column at a time.
+	'''
+	if pyarrow is None:
+		raise RuntimeError("The columnar reader needs pyarrow (pip install pyarrow)")
+
+	with open(csv_filename, encoding="utf-8") as csv_file:
+		number_of_columns = len(next(csv.reader(csv_file, delimiter=",")))
+	column_types = dict(("f{}".format(i), "string") for i in range(number_of_columns))
+
+	reader = pyarrow.csv.open_csv(csv_filename,
+		read_options=pyarrow.csv.ReadOptions(block_size=columnar_block_size, skip_rows=1, autogenerate_column_names=True),
+		parse_options=pyarrow.csv.ParseOptions(newlines_in_values=True),
+		convert_options=pyarrow.csv.ConvertOptions(column_types=column_types, null_values=[""],
+			strings_can_be_null=True, quoted_strings_can_be_null=True))
+	for chunk in reader:
+		columns = [pyarrow.compute.fill_null(column, null_value) for column in chunk.columns]
+		yield pyarrow.RecordBatch.from_arrays(columns, names=chunk.schema.names)
+
+
+# ***************** LOOKUP TABLE CACHE *****************
+# The lookup tables shared by the datasets and their columns. The first
+# column of each table is its primary key.
+dimension_tables = {
+	"Cause": ("CauseName", "CauseNameExpanded"),
+	"Location": ("LocationID", "LocationAbbr", "LocationDesc"),
+	"TopicInformation": ("TopicID", "Topic"),
+	"QuestionInformation": ("QuestionID", "Question"),
+	"ClassInformation": ("ClassID", "Class"),
+	"DataValueTypeInformation": ("DataValueTypeID", "DataValueType"),
+	"StratificationInformation": ("StratificationID1", "StratificationCategoryID1", "Stratification1", "StratificationCategory1"),
+}
+
+class DimensionCache:
+	'''
+	Class that remembers which lookup table keys already exist in the
+	database or have already been queued during this load, so each
+	distinct lookup row is only written once. New rows are held until
+	flush() writes them with one INSERT per table.
+	'''
+
+	def __init__(self, cursor):
+		'''
+		Loads the keys that are already in the database.
+		'''
+		self.known_keys = dict()
+		self.pending_rows = dict()
+		for table, columns in dimension_tables.items():
+			cursor.execute("SELECT {} FROM {}".format(columns[0], table))
+			self.known_keys[table] = set(row[0] for row in cursor.fetchall())
+			self.pending_rows[table] = []
+
+	def add(self, table, row):
+		'''
+		Queues a row (a tuple in the column order of dimension_tables) for
+		the lookup table if its key has not been seen yet.
+		'''
+		if row[0] not in self.known_keys[table]:
+			self.known_keys[table].add(row[0])
+			self.pending_rows[table].append(row)
+
+	def flush(self, cursor):
+		'''
+		Writes all queued rows, one batched INSERT per lookup table.
+		'''
+		for table, rows in self.pending_rows.items():
+			if rows:
+				insert_query = "INSERT INTO {}({}) VALUES %s ON CONFLICT DO NOTHING".format(table, ", ".join(dimension_tables[table]))
+				psycopg2.extras.execute_values(cursor, insert_query, rows, page_size=batch_size)
+				self.pending_rows[table] = []
 
 
 # ***************** FILENAMES *****************
@@ -40,285 +296,666 @@ leading_causes_of_death_file = "datasets/NCHS_-_Leading_Causes_of_Death__United_
 nutrition_file = "datasets/Nutrition__Physical_Activity__and_Obesity_-_Behavioral_Risk_Factor_Surveillance_System.csv"
 chronic_disease_indicators_file = "datasets/U.S._Chronic_Disease_Indicators__CDI_.csv"
 
+# Number of rows sent to the database in each INSERT by the row loaders
+batch_size = 10000
 
-# ***************** General Set Up *****************
-connection_string = "host='localhost' dbname='dbms_final_project' user='dbms_project_user' password='dbms_password'"
-conn = psycopg2.connect(connection_string)
-cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-
+# Number of rows loaded between commits. A checkpoint is saved with every
+# commit, so an interrupted load resumes after the last committed rows.
+commit_every = 100000
 
-# ***************** Use the schema file to set up the database *****************
-cursor.execute(open("schema.sql", "r").read())
+# Read the drug poisoning CSV file with the columnar reader instead of the csv module
+columnar = False
 
 
 # ***************** LOAD DATA FROM LEADING_CAUSES_OF_DEATH FILE *****************
-count = 0 
-insert_query = ""
-with open(leading_causes_of_death_file) as leading_causes_of_death: 
-	leading_causes_of_death_reader = csv.reader(leading_causes_of_death, delimiter=",")
-	for row in leading_causes_of_death_reader: 
-		if count > 0: 
-
-			#Add values to Cause table: 
-			insert_query = "INSERT INTO Cause(CauseName, CauseNameExpanded) VALUES (%s, %s) ON CONFLICT DO NOTHING"	
-			cursor.execute(insert_query, (row[2], row[1]))
-
-			#Add values to LeadingCauseOfDeath table: 
-			insert_query = """INSERT INTO LeadingCauseOfDeath(Year, CauseName, State, Deaths, AgeAdjustedDeathRate) 
-						VALUES (%s, %s, %s, %s, %s) ON CONFLICT DO NOTHING"""	
-			cursor.execute(insert_query, (int(row[0]), row[2], row[3], int(row[4]), float(row[5])))
-
-		count += 1	
-print("Leading Causes of Death: ", count)
+def loadLeadingCausesOfDeath(cursor, dimension_cache, years=None):
+	'''
+	Function to load the leading causes of death CSV file into the
+	Cause and LeadingCauseOfDeath tables. It commits every commit_every
+	rows, and resumes after the last checkpoint. If years is given, only
+	the rows of those years are loaded.
+	'''
+	count = 0
+	insert_query = """INSERT INTO LeadingCauseOfDeath(Year, CauseName, State, Deaths, AgeAdjustedDeathRate)
+					VALUES %s ON CONFLICT DO NOTHING"""
+	batch = []
+	start_row = getCheckpoint(cursor, leading_causes_of_death_file)
+	committed_row = start_row
+	with open(leading_causes_of_death_file) as leading_causes_of_death:
+		leading_causes_of_death_reader = csv.reader(leading_causes_of_death, delimiter=",")
+		for row in leading_causes_of_death_reader:
+			# Skip the header, the rows committed before an interruption and the years not being loaded
+			if count > start_row and (years is None or partitionYear(row[0]) in years):
+
+				#Add values to Cause table:
+				dimension_cache.add("Cause", (row[2], row[1]))
+
+				#Add values to LeadingCauseOfDeath table:
+				batch.append((int(row[0]), row[2], row[3], int(row[4]), float(row[5])))
+				# Commit every commit_every rows, even if the batch is not full yet
+				if len(batch) == batch_size or count - committed_row >= commit_every:
+					insertBatch(cursor, dimension_cache, insert_query, batch)
+					batch = []
+					if count - committed_row >= commit_every:
+						saveCheckpoint(cursor, leading_causes_of_death_file, count)
+						committed_row = count
+
+			count += 1
+	insertBatch(cursor, dimension_cache, insert_query, batch)
+	saveCheckpoint(cursor, leading_causes_of_death_file, count - 1)
+	print("Leading Causes of Death: ", count)
 
 
 # ***************** LOAD DATA FROM NUTRITION FILE *****************
-count = 0 
-insert_query = ""
-with open(nutrition_file) as nutrition: 
-	nutrition_reader = csv.reader(nutrition, delimiter=",")
-	for row in nutrition_reader: 
-		if count > 0: 
-
-			#Add values to Location table: 
-			insert_query = "INSERT INTO Location(LocationID, LocationAbbr, LocationDesc) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING" 
-			cursor.execute(insert_query, (row[28], row[2], row[3]))
+def loadNutrition(cursor, dimension_cache, years=None):
+	'''
+	Function to load the nutrition CSV file into the Nutrition table
+	and its lookup tables, in batches of batch_size rows. It commits
+	every commit_every rows, and resumes after the last checkpoint. If
+	years is given, only the rows of those years are loaded.
+	'''
+	count = 0
+	insert_query = """INSERT INTO Nutrition(YearStart, YearEnd, DataSource, DataValueUnit, DataValue, DataValueFootnoteSymbol,
+	DataValueFootnote, LowConfidenceLimit, HighConfidenceLimit, SampleSize, GeoLocation, ClassID, TopicID, DataValueTypeID,
+	StratificationID1, QuestionID, LocationID) VALUES %s ON CONFLICT DO NOTHING"""
+	batch = []
+	start_row = getCheckpoint(cursor, nutrition_file)
+	committed_row = start_row
+	with open(nutrition_file) as nutrition:
+		nutrition_reader = csv.reader(nutrition, delimiter=",")
+		for row in nutrition_reader:
+			# Skip the header, the rows committed before an interruption and the years not being loaded
+			if count > start_row and (years is None or partitionYear(row[0]) in years):
+
+				# Check for null values for float and int values
+				if row[0] == "":
+					row[0] = 0
+				if row[1] == "":
+					row[1] = 0
+				if row[14] == "":
+					row[14] = -1
+				if row[10] == "":
+					row[10] = -1
+				if row[15] == "":
+					row[15] = -1
+				if row[16] == "":
+					row[16] = 0
+				if row[28] == "":
+					row[28] = 0
 				
-			#Add values to TopicInformation table: 
-			insert_query = "INSERT INTO TopicInformation(TopicID, Topic) VALUES (%s, %s) ON CONFLICT DO NOTHING"
-			cursor.execute(insert_query, (row[25], row[6]))
-
-			#Add values to QuestionInformation table: 
-			insert_query = "INSERT INTO QuestionInformation(QuestionId, Question) VALUES (%s, %s) ON CONFLICT DO NOTHING"
-			cursor.execute(insert_query, (row[26], row[7]))
-
-			#Add values to ClassInformation table: 
-			insert_query = "INSERT INTO ClassInformation(ClassID, Class) VALUES (%s, %s) ON CONFLICT DO NOTHING"
-			cursor.execute(insert_query, (row[24], row[5]))
-
-			#Add values to DataValueTypeInformation table:
-			insert_query = "INSERT INTO DataValueTypeInformation(DataValueTypeID, DataValueType) VALUES (%s, %s) ON CONFLICT DO NOTHING"
-			cursor.execute(insert_query, (row[27], row[9]))
-
-			#Add values to StratificationInformation table: 
-			insert_query = """INSERT INTO StratificationInformation(StratificationID1, StratificationCategoryID1,
-								 Stratification1, StratificationCategory1) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING"""
-			cursor.execute(insert_query, (row[32], row[31], row[30], row[29]))
-
-			# Check for null values for float and int values
-			if row[0] == "":
-				row[0] = 0 
-			if row[1] == "":
-				row[1] = 0 
-			if row[14] == "": 
-				row[14] = -1
-			if row[10] == "":
-				row[10] = -1
-			if row[15] == "":
-				row[15] = -1
-			if row[16] == "":
-				row[16] = 0 
-			if row[28] == "":
-				row[28] = 0 
-
-			# Insert the main row data into the Nutrition table
-			insert_query = """INSERT INTO Nutrition(YearStart, YearEnd, DataSource, DataValueUnit, DataValue, DataValueFootnoteSymbol, 
-			DataValueFootnote, LowConfidenceLimit, HighConfidenceLimit, SampleSize, GeoLocation, ClassID, TopicID, DataValueTypeID, 
-			StratificationID1, QuestionID, LocationID) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-			ON CONFLICT DO NOTHING"""
-			cursor.execute(insert_query, (int(row[0]), int(row[1]), row[4], row[8], float(row[10]), row[12], row[13], float(row[14]), 
-				float(row[15]), int(row[16]), row[23], row[24], row[25], row[27], row[32], row[26], int(row[28])))
-
-		count += 1
-print("Nutrition: ", count)
+				#Add values to the lookup tables:
+				dimension_cache.add("Location", (int(row[28]), row[2], row[3]))
+				dimension_cache.add("TopicInformation", (row[25], row[6]))
+				dimension_cache.add("QuestionInformation", (row[26], row[7]))
+				dimension_cache.add("ClassInformation", (row[24], row[5]))
+				dimension_cache.add("DataValueTypeInformation", (row[27], row[9]))
+				dimension_cache.add("StratificationInformation", (row[32], row[31], row[30], row[29]))
+
+				# Add the main row data to the batch for the Nutrition table
+				batch.append((int(row[0]), int(row[1]), row[4], row[8], float(row[10]), row[12], row[13], float(row[14]),
+					float(row[15]), int(row[16]), row[23], row[24], row[25], row[27], row[32], row[26], int(row[28])))
+				# Commit every commit_every rows, even if the batch is not full yet
+				if len(batch) == batch_size or count - committed_row >= commit_every:
+					insertBatch(cursor, dimension_cache, insert_query, batch)
+					batch = []
+					if count - committed_row >= commit_every:
+						saveCheckpoint(cursor, nutrition_file, count)
+						committed_row = count
+
+			count += 1
+	insertBatch(cursor, dimension_cache, insert_query, batch)
+	saveCheckpoint(cursor, nutrition_file, count - 1)
+	print("Nutrition: ", count)
+
+def bulkLoadNutrition(cursor, lookup_table_turn=None, years=None):
+	'''
+	Function to load the nutrition CSV file with COPY. The file is streamed
+	into a staging table, and each table is then filled with one set-based
+	INSERT ... SELECT. The null substitutions are made in SQL.
+	The lookup tables are written inside lookup_table_turn (see
+	lookupTableTurn), if it is given. If years is given, only the rows
+	of those years are loaded.
+	'''
+	count = copyToStagingTable(cursor, "nutrition_staging", nutrition_file)
+	if years is not None:
+		cursor.execute("DELETE FROM nutrition_staging WHERE {} <> ALL(%s)".format(nullDefault("c0", 0, "int")), (list(years),))
+
+	#Add values to the lookup tables (first row in the file wins, as in loadNutrition):
+	with lookup_table_turn or contextlib.nullcontext():
+		cursor.execute("""INSERT INTO Location(LocationID, LocationAbbr, LocationDesc)
+						SELECT DISTINCT ON (c28) {}, c2, c3 FROM nutrition_staging ORDER BY c28, lineno
+						ON CONFLICT DO NOTHING""".format(nullDefault("c28", 0, "int")))
+		cursor.execute("""INSERT INTO TopicInformation(TopicID, Topic)
+						SELECT DISTINCT ON (c25) c25, c6 FROM nutrition_staging ORDER BY c25, lineno
+						ON CONFLICT DO NOTHING""")
+		cursor.execute("""INSERT INTO QuestionInformation(QuestionID, Question)
+						SELECT DISTINCT ON (c26) c26, c7 FROM nutrition_staging ORDER BY c26, lineno
+						ON CONFLICT DO NOTHING""")
+		cursor.execute("""INSERT INTO ClassInformation(ClassID, Class)
+						SELECT DISTINCT ON (c24) c24, c5 FROM nutrition_staging ORDER BY c24, lineno
+						ON CONFLICT DO NOTHING""")
+		cursor.execute("""INSERT INTO DataValueTypeInformation(DataValueTypeID, DataValueType)
+						SELECT DISTINCT ON (c27) c27, c9 FROM nutrition_staging ORDER BY c27, lineno
+						ON CONFLICT DO NOTHING""")
+		cursor.execute("""INSERT INTO StratificationInformation(StratificationID1, StratificationCategoryID1, Stratification1, StratificationCategory1)
+						SELECT DISTINCT ON (c32) c32, c31, c30, c29 FROM nutrition_staging ORDER BY c32, lineno
+						ON CONFLICT DO NOTHING""")
+
+	# Merge the main row data into the Nutrition table, committing every commit_every rows
+	# (starting after the rows committed before an interruption)
+	start_row = getCheckpoint(cursor, nutrition_file)
+	for first_row in range(start_row, count, commit_every):
+		cursor.execute("""INSERT INTO Nutrition(YearStart, YearEnd, DataSource, DataValueUnit, DataValue, DataValueFootnoteSymbol,
+						DataValueFootnote, LowConfidenceLimit, HighConfidenceLimit, SampleSize, GeoLocation, ClassID, TopicID, DataValueTypeID,
+						StratificationID1, QuestionID, LocationID)
+						SELECT {}, {}, c4, c8, {}, c12, c13, {}, {}, {}, c23, c24, c25, c27, c32, c26, {}
+						FROM nutrition_staging WHERE lineno > %s AND lineno <= %s ORDER BY lineno
+						ON CONFLICT DO NOTHING""".format(
+						nullDefault("c0", 0, "int"), nullDefault("c1", 0, "int"), nullDefault("c10", -1, "numeric"),
+						nullDefault("c14", -1, "numeric"), nullDefault("c15", -1, "numeric"), nullDefault("c16", 0, "int"),
+						nullDefault("c28", 0, "int")), (first_row, first_row + commit_every))
+		saveCheckpoint(cursor, nutrition_file, min(first_row + commit_every, count))
+
+	cursor.execute("DROP TABLE nutrition_staging")
+	print("Nutrition: ", count)
 
 
 # ***************** LOAD DATA FROM CHRONIC DISEASE INDICATORS FILE *****************
-count = 0 
-location_dict = dict()
-topic_info_dict = dict()
-question_info_dict = dict()
-data_value_dict = dict()
-strat_info_dict = dict()
-insert_query = ""
-with open(chronic_disease_indicators_file) as chronic_disease_indicators: 
-	chronic_disease_indicators_reader = csv.reader(chronic_disease_indicators, delimiter=",")
-	for row in chronic_disease_indicators_reader: 
-		if count > 0:
-
-			#Add values to Location table: 
-			insert_query = "INSERT INTO Location(LocationID, LocationAbbr, LocationDesc) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING" 
-			cursor.execute(insert_query, (row[24], row[2], row[3]))
-
-			#Add values to TopicInformation table: 
-			insert_query = "INSERT INTO TopicInformation(TopicID, Topic) VALUES (%s, %s) ON CONFLICT DO NOTHING"
-			cursor.execute(insert_query, (row[25], row[5]))
-
-			#Add values to QuestionInformation table: 
-			insert_query = "INSERT INTO QuestionInformation(QuestionID, Question) VALUES (%s, %s) ON CONFLICT DO NOTHING"
-			cursor.execute(insert_query, (row[26], row[6]))
-
-			#Add values to DataValueTypeInformation table: 
-			insert_query = "INSERT INTO DataValueTypeInformation(DataValueTypeID, DataValueType) VALUES (%s, %s) ON CONFLICT DO NOTHING"
-			cursor.execute(insert_query, (row[27], row[9]))
-
-			#Add values to StratificationInformation table: 
-			insert_query = """INSERT INTO StratificationInformation(StratificationID1, StratificationCategoryID1,
-								 Stratification1, StratificationCategory1) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING"""
-			cursor.execute(insert_query, (row[29], row[28], row[17], row[16]))
-
-			# Check for null values for float and int values
-			if row[0] == "":
-				row[0] = 0 
-			if row[1] == "":
-				row[1] = 0 
-			if row[14] == "": 
-				row[14] = -1
-			if row[11] == "":
-				row[11] = -1
-			if row[15] == "":
-				row[15] = -1
-			if row[24] == "":
-				row[24] = 0 
-
-			# Insert the main row data into the ChronicDiseaseIndicator table
-			insert_query = """INSERT INTO ChronicDiseaseIndicator(YearStart, YearEnd, DataSource, DataValueUnit, DataValue, 
-			DataValueAlt, DataValueFootnoteSymbol, DataValueFootnote, LowConfidenceLimit, HighConfidenceLimit, GeoLocation, TopicID, 
-			StratificationID1, DataValueTypeID, QuestionID, LocationID) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) 
-			ON CONFLICT DO NOTHING"""
-			cursor.execute(insert_query, (int(row[0]), int(row[1]), row[4], row[8], row[10], float(row[11]), row[12], row[13], float(row[14]), 
-				float(row[15]), row[22], row[25], row[29], row[27], row[26], int(row[24])))
-		count += 1
-print("Chronic Disease Indicators: ", count)
-
-
-conn.commit()
-# ***************** END OF RELATIONAL DATABASE *****************
-
+def loadChronicDiseaseIndicators(cursor, dimension_cache, years=None):
+	'''
+	Function to load the chronic disease indicators CSV file into the
+	ChronicDiseaseIndicator table and its lookup tables, in batches of
+	batch_size rows. It commits every commit_every rows, and resumes
+	after the last checkpoint. If years is given, only the rows of those
+	years are loaded.
+	'''
+	count = 0
+	insert_query = """INSERT INTO ChronicDiseaseIndicator(YearStart, YearEnd, DataSource, DataValueUnit, DataValue,
+	DataValueAlt, DataValueFootnoteSymbol, DataValueFootnote, LowConfidenceLimit, HighConfidenceLimit, GeoLocation, TopicID,
+	StratificationID1, DataValueTypeID, QuestionID, LocationID) VALUES %s ON CONFLICT DO NOTHING"""
+	batch = []
+	start_row = getCheckpoint(cursor, chronic_disease_indicators_file)
+	committed_row = start_row
+	with open(chronic_disease_indicators_file) as chronic_disease_indicators:
+		chronic_disease_indicators_reader = csv.reader(chronic_disease_indicators, delimiter=",")
+		for row in chronic_disease_indicators_reader:
+			# Skip the header, the rows committed before an interruption and the years not being loaded
+			if count > start_row and (years is None or partitionYear(row[0]) in years):
+
+				# Check for null values for float and int values
+				if row[0] == "":
+					row[0] = 0
+				if row[1] == "":
+					row[1] = 0
+				if row[14] == "":
+					row[14] = -1
+				if row[11] == "":
+					row[11] = -1
+				if row[15] == "":
+					row[15] = -1
+				if row[24] == "":
+					row[24] = 0
+
+				#Add values to the lookup tables:
+				dimension_cache.add("Location", (int(row[24]), row[2], row[3]))
+				dimension_cache.add("TopicInformation", (row[25], row[5]))
+				dimension_cache.add("QuestionInformation", (row[26], row[6]))
+				dimension_cache.add("DataValueTypeInformation", (row[27], row[9]))
+				dimension_cache.add("StratificationInformation", (row[29], row[28], row[17], row[16]))
+
+				# Add the main row data to the batch for the ChronicDiseaseIndicator table
+				batch.append((int(row[0]), int(row[1]), row[4], row[8], row[10], float(row[11]), row[12], row[13], float(row[14]),
+					float(row[15]), row[22], row[25], row[29], row[27], row[26], int(row[24])))
+				# Commit every commit_every rows, even if the batch is not full yet
+				if len(batch) == batch_size or count - committed_row >= commit_every:
+					insertBatch(cursor, dimension_cache, insert_query, batch)
+					batch = []
+					if count - committed_row >= commit_every:
+						saveCheckpoint(cursor, chronic_disease_indicators_file, count)
+						committed_row = count
+
+			count += 1
+	insertBatch(cursor, dimension_cache, insert_query, batch)
+	saveCheckpoint(cursor, chronic_disease_indicators_file, count - 1)
+	print("Chronic Disease Indicators: ", count)
+
+def bulkLoadChronicDiseaseIndicators(cursor, lookup_table_turn=None, years=None):
+	'''
+	Function to load the chronic disease indicators CSV file with COPY.
+	The file is streamed into a staging table, and each table is then
+	filled with one set-based INSERT ... SELECT. The null substitutions
+	are made in SQL. The lookup tables are written inside lookup_table_turn
+	(see lookupTableTurn), if it is given. If years is given, only the
+	rows of those years are loaded.
+	'''
+	count = copyToStagingTable(cursor, "cdi_staging", chronic_disease_indicators_file)
+	if years is not None:
+		cursor.execute("DELETE FROM cdi_staging WHERE {} <> ALL(%s)".format(nullDefault("c0", 0, "int")), (list(years),))
+
+	#Add values to the lookup tables (first row in the file wins, as in loadChronicDiseaseIndicators):
+	with lookup_table_turn or contextlib.nullcontext():
+		cursor.execute("""INSERT INTO Location(LocationID, LocationAbbr, LocationDesc)
+						SELECT DISTINCT ON (c24) {}, c2, c3 FROM cdi_staging ORDER BY c24, lineno
+						ON CONFLICT DO NOTHING""".format(nullDefault("c24", 0, "int")))
+		cursor.execute("""INSERT INTO TopicInformation(TopicID, Topic)
+						SELECT DISTINCT ON (c25) c25, c5 FROM cdi_staging ORDER BY c25, lineno
+						ON CONFLICT DO NOTHING""")
+		cursor.execute("""INSERT INTO QuestionInformation(QuestionID, Question)
+						SELECT DISTINCT ON (c26) c26, c6 FROM cdi_staging ORDER BY c26, lineno
+						ON CONFLICT DO NOTHING""")
+		cursor.execute("""INSERT INTO DataValueTypeInformation(DataValueTypeID, DataValueType)
+						SELECT DISTINCT ON (c27) c27, c9 FROM cdi_staging ORDER BY c27, lineno
+						ON CONFLICT DO NOTHING""")
+		cursor.execute("""INSERT INTO StratificationInformation(StratificationID1, StratificationCategoryID1, Stratification1, StratificationCategory1)
+						SELECT DISTINCT ON (c29) c29, c28, c17, c16 FROM cdi_staging ORDER BY c29, lineno
+						ON CONFLICT DO NOTHING""")
+
+	# Merge the main row data into the ChronicDiseaseIndicator table, committing every commit_every rows
+	# (starting after the rows committed before an interruption)
+	start_row = getCheckpoint(cursor, chronic_disease_indicators_file)
+	for first_row in range(start_row, count, commit_every):
+		cursor.execute("""INSERT INTO ChronicDiseaseIndicator(YearStart, YearEnd, DataSource, DataValueUnit, DataValue,
+						DataValueAlt, DataValueFootnoteSymbol, DataValueFootnote, LowConfidenceLimit, HighConfidenceLimit, GeoLocation, TopicID,
+						StratificationID1, DataValueTypeID, QuestionID, LocationID)
+						SELECT {}, {}, c4, c8, c10, {}, c12, c13, {}, {}, c22, c25, c29, c27, c26, {}
+						FROM cdi_staging WHERE lineno > %s AND lineno <= %s ORDER BY lineno
+						ON CONFLICT DO NOTHING""".format(
+						nullDefault("c0", 0, "int"), nullDefault("c1", 0, "int"), nullDefault("c11", -1, "numeric"),
+						nullDefault("c14", -1, "numeric"), nullDefault("c15", -1, "numeric"), nullDefault("c24", 0, "int")), (first_row, first_row + commit_every))
+		saveCheckpoint(cursor, chronic_disease_indicators_file, min(first_row + commit_every, count))
+
+	cursor.execute("DROP TABLE cdi_staging")
+	print("Chronic Disease Indicators: ", count)
 
 
 # ***************** LOAD DATA FROM DRUG_POISONING FILE *****************
 # ************ NON RELATIONAL DATABASE - WRITE AN XML FILE *************
-root = minidom.Document()
-xml = root.createElement('DrugPoisoning')
-root.appendChild(xml)
-count = 0 
-
-with open(drug_poisoning_file, encoding = "utf-8") as drug_poisoning: 
-	drug_poisoning_reader = csv.reader(drug_poisoning, delimiter = ",")
-	for row in drug_poisoning_reader: 
-		if count != 0: 
-
+def drugPoisoningRows():
+	'''
+	Function to read the rows of the drug poisoning CSV file for
+	writeDrugPoisoningXML. Yields (row, lower_age, upper_age,
+	state_rate_lower, state_rate_upper) for each row, with "-1" for
+	missing data.
+	'''
+	with open(drug_poisoning_file, encoding = "utf-8") as drug_poisoning:
+		drug_poisoning_reader = csv.reader(drug_poisoning, delimiter = ",")
+		next(drug_poisoning_reader, None)
+		for row in drug_poisoning_reader:
 			#insert -1 for missing data
 			for i in range(len(row)): 
 				if row[i] == "":
 					row[i] = "-1"
 			
-			# Create the root element
-			drugPoisoningStatistic = root.createElement('DrugPoisoningStatistic')
-
-			# Add year to the root element
-			year = root.createElement('Year')
-			year.appendChild(root.createTextNode(row[0]))
-			drugPoisoningStatistic.appendChild(year)
-
-			# Add sex to the root element
-			sex = root.createElement('Sex')
-			sex.appendChild(root.createTextNode(row[1]))
-			drugPoisoningStatistic.appendChild(sex)
-
-			# Create an AgeRange element that will have lowerbound and upperbound 
-			# as child elements. Then add AgeRange element to root element. 
-			ageRange = root.createElement('AgeRange')
-			lowerBound = root.createElement('LowerBound')
-			upperBound = root.createElement('UpperBound')
-			lower, upper = splitAge(row[2])
-			lowerBound.appendChild(root.createTextNode(str(lower)))
-			upperBound.appendChild(root.createTextNode(str(upper)))
-			ageRange.appendChild(lowerBound)
-			ageRange.appendChild(upperBound)
-			drugPoisoningStatistic.appendChild(ageRange)
-
-			# Add race to the root element
-			race = root.createElement('Race')
-			race.appendChild(root.createTextNode(row[3]))
-			drugPoisoningStatistic.appendChild(race)
-
-			# Add State to the root element
-			state = root.createElement('State')
-			state.appendChild(root.createTextNode(row[4]))
-			drugPoisoningStatistic.appendChild(state)
-
-			# Add deaths to the root element
-			deaths = root.createElement('Deaths')
-			deaths.appendChild(root.createTextNode(row[5]))
-			drugPoisoningStatistic.appendChild(deaths)
-
-			# Add population to the root element
-			population = root.createElement('Population')
-			population.appendChild(root.createTextNode(row[6]))
-			drugPoisoningStatistic.appendChild(population)
-
-			# Add DeathRate element to root element. The DeathRate
-			# contains child elements with information about the 
-			# DeathRate.
-			deathRate = root.createElement('DeathRate')
-			deathRate.appendChild(root.createTextNode(row[7]))
-			stderr = root.createElement('Stderr')
-			stderr.appendChild(root.createTextNode(row[8]))
-			lowConfidenceLimit = root.createElement('LowConfidenceLimit')
-			lowConfidenceLimit.appendChild(root.createTextNode(row[9]))
-			upperConfidenceLimit = root.createElement('UpperConfidenceLimit')
-			upperConfidenceLimit.appendChild(root.createTextNode(row[10]))
+			lower_age, upper_age = splitAge(row[2])
 			lower,upper = "-1","-1"
 			if row[15] != "-1":
 				lower,upper = row[15].split('–')
-			stateRateLowerBound = root.createElement('StateRateLowerBound')
-			stateRateLowerBound.appendChild(root.createTextNode(lower))
-			stateRateUpperBound = root.createElement('StateRateUpperBound')
-			stateRateUpperBound.appendChild(root.createTextNode(upper))
-			usRate = root.createElement('USRate')
-			usRate.appendChild(root.createTextNode(row[16]))
-			crude = root.createElement("Crude")
-			crude.appendChild(deathRate)
-			crude.appendChild(stderr)
-			crude.appendChild(lowConfidenceLimit)
-			crude.appendChild(upperConfidenceLimit)
-			crude.appendChild(stateRateLowerBound)
-			crude.appendChild(stateRateUpperBound)
-			crude.appendChild(usRate)
-			drugPoisoningStatistic.appendChild(crude)
-
-			# Add AdjustedRate to the root element. The AdjustedRate 
-			# contains child elements with information about the 
-			# adjusted rate. 
-			adjustedRate = root.createElement('AdjustedRate')
-			adjustedRate.appendChild(root.createTextNode(row[11]))
-			stderr = root.createElement('Stderr')
-			stderr.appendChild(root.createTextNode(row[12]))
-			lowConfidenceLimit = root.createElement('LowConfidenceLimit')
-			lowConfidenceLimit.appendChild(root.createTextNode(row[13]))
-			upperConfidenceLimit = root.createElement('UpperConfidenceLimit')
-			upperConfidenceLimit.appendChild(root.createTextNode(row[14]))
-			usRate = root.createElement('USRate')
-			usRate.appendChild(root.createTextNode(row[17]))
-			ageInfo = root.createElement('AgeInfo')
-			ageInfo.appendChild(adjustedRate)
-			ageInfo.appendChild(stderr)
-			ageInfo.appendChild(lowConfidenceLimit)
-			ageInfo.appendChild(upperConfidenceLimit)
-			ageInfo.appendChild(usRate)
-			drugPoisoningStatistic.appendChild(ageInfo)
-
-			#Add the entire 'row' of data to the XML element.
-			xml.appendChild(drugPoisoningStatistic)
-
-		count += 1 
-
-print("Drug Poisoning: ", count)
-
-# Write the XML element to an XML file
-xml_str = root.toprettyxml(indent="\t", encoding="utf-8")
-xml_file = "drug-poisoning-mortality-data.xml"
-with open(xml_file, "wb") as out_file: 
-	out_file.write(xml_str)
\ No newline at end of file
+			yield row, lower_age, upper_age, lower, upper
+
+def columnarDrugPoisoningRows():
+	'''
+	Columnar version of drugPoisoningRows. The missing data, the age
+	ranges (each distinct one is only split once) and the state rate
+	ranges are handled a whole column at a time.
+	'''
+	for chunk in readColumnarChunks(drug_poisoning_file, null_value="-1"):
+		ages = chunk.column(2).dictionary_encode()
+		age_bounds = [splitAge(age) for age in ages.dictionary.to_pylist()]
+		lower_ages = pyarrow.array([bounds[0] for bounds in age_bounds]).take(ages.indices)
+		upper_ages = pyarrow.array([bounds[1] for bounds in age_bounds]).take(ages.indices)
+
+		# Split the state rate ranges (e.g. "9.4–11.9"), with -1 for both bounds if the range is missing
+		state_rates = pyarrow.compute.if_else(pyarrow.compute.equal(chunk.column(15), "-1"), "-1–-1", chunk.column(15))
+		state_rate_bounds = pyarrow.compute.split_pattern(state_rates, "–")
+		lower_rates = pyarrow.compute.list_element(state_rate_bounds, 0)
+		upper_rates = pyarrow.compute.list_element(state_rate_bounds, 1)
+
+		rows = zip(*(column.to_pylist() for column in chunk.columns))
+		yield from zip(rows, lower_ages.to_pylist(), upper_ages.to_pylist(), lower_rates.to_pylist(), upper_rates.to_pylist())
+
+def writeDrugPoisoningXML():
+	'''
+	Function to write the drug poisoning CSV file out as the
+	drug-poisoning-mortality-data.xml file (non-relational database).
+	The file is written incrementally: each DrugPoisoningStatistic element
+	is built and written as its row is read, so only one row is ever held
+	in memory. The columns that the application queries are also collected 
+	(straight into typed arrays, see Database.DrugPoisoningDataBuilder)
+	and written to the binary snapshot file that Database.py loads instead
+	of parsing the XML file.
+	'''
+	count = 1 # (the header line is counted too)
+	xml_file = "drug-poisoning-mortality-data.xml"
+	snapshot = Database.DrugPoisoningDataBuilder()
+	drug_poisoning_rows = columnarDrugPoisoningRows() if columnar else drugPoisoningRows()
+
+	with open(xml_file, "wb") as out_file:
+		out_file.write(b'<?xml version="1.0" encoding="utf-8"?>\n')
+		with etree.xmlfile(out_file, encoding="utf-8") as xml, xml.element('DrugPoisoning'):
+			for row, lower_age, upper_age, lower, upper in drug_poisoning_rows:
+				# Create the root element
+				drugPoisoningStatistic = etree.Element('DrugPoisoningStatistic')
+
+				# Add year, sex to the root element
+				etree.SubElement(drugPoisoningStatistic, 'Year').text = row[0]
+				etree.SubElement(drugPoisoningStatistic, 'Sex').text = row[1]
+
+				# Create an AgeRange element that will have lowerbound and upperbound
+				# as child elements.
+				ageRange = etree.SubElement(drugPoisoningStatistic, 'AgeRange')
+				etree.SubElement(ageRange, 'LowerBound').text = str(lower_age)
+				etree.SubElement(ageRange, 'UpperBound').text = str(upper_age)
+
+				# Add race, state, deaths and population to the root element
+				etree.SubElement(drugPoisoningStatistic, 'Race').text = row[3]
+				etree.SubElement(drugPoisoningStatistic, 'State').text = row[4]
+				etree.SubElement(drugPoisoningStatistic, 'Deaths').text = row[5]
+				etree.SubElement(drugPoisoningStatistic, 'Population').text = row[6]
+
+				# Add Crude element to root element. The Crude element
+				# contains child elements with information about the
+				# DeathRate.
+				crude = etree.SubElement(drugPoisoningStatistic, 'Crude')
+				etree.SubElement(crude, 'DeathRate').text = row[7]
+				etree.SubElement(crude, 'Stderr').text = row[8]
+				etree.SubElement(crude, 'LowConfidenceLimit').text = row[9]
+				etree.SubElement(crude, 'UpperConfidenceLimit').text = row[10]
+				etree.SubElement(crude, 'StateRateLowerBound').text = lower
+				etree.SubElement(crude, 'StateRateUpperBound').text = upper
+				etree.SubElement(crude, 'USRate').text = row[16]
+
+				# Add AgeInfo to the root element. The AgeInfo element
+				# contains child elements with information about the
+				# adjusted rate.
+				ageInfo = etree.SubElement(drugPoisoningStatistic, 'AgeInfo')
+				etree.SubElement(ageInfo, 'AdjustedRate').text = row[11]
+				etree.SubElement(ageInfo, 'Stderr').text = row[12]
+				etree.SubElement(ageInfo, 'LowConfidenceLimit').text = row[13]
+				etree.SubElement(ageInfo, 'UpperConfidenceLimit').text = row[14]
+				etree.SubElement(ageInfo, 'USRate').text = row[17]
+
+				# Write the entire 'row' of data to the XML file, indented
+				# the same way as the rest of the document.
+				etree.indent(drugPoisoningStatistic, space="\t", level=1)
+				xml.write("\n\t", drugPoisoningStatistic)
+
+				snapshot.add(int(row[0]), row[4], row[1], row[3], lower_age, upper_age, int(row[5]), int(row[6]))
+
+				count += 1
+			xml.write("\n")
+		out_file.write(b"\n")
+
+	print("Drug Poisoning: ", count)
+
+	# Write the binary snapshot of the XML file
+	snapshot.build().writeSnapshot(Database.snapshot_file, xml_file)
+
+
+# ***************** INCREMENTAL LOAD *****************
+# The table and partition (year) column that each relational CSV file is loaded into
+partitioned_tables = {
+	leading_causes_of_death_file: ("LeadingCauseOfDeath", "Year"),
+	nutrition_file: ("Nutrition", "YearStart"),
+	chronic_disease_indicators_file: ("ChronicDiseaseIndicator", "YearStart"),
+}
+
+def partitionYear(value):
+	'''
+	Function to get the partition (year) of a CSV row from its first
+	column, using 0 for a missing year as the loaders do.
+	'''
+	return int(value) if value != "" else 0
+
+def partitionDigests(csv_filename):
+	'''
+	Function to compute a sha256 digest of the rows of each year of a
+	CSV file. Returns a dictionary of year: hex digest.
+	'''
+	digests = dict()
+	with open(csv_filename, encoding="utf-8") as csv_file:
+		reader = csv.reader(csv_file, delimiter=",")
+		next(reader, None)
+		for row in reader:
+			year = partitionYear(row[0])
+			if year not in digests:
+				digests[year] = hashlib.sha256()
+			digests[year].update("\x1f".join(row).encode("utf-8") + b"\x1e")
+	return {year: digest.hexdigest() for year, digest in digests.items()}
+
+def getFileDigest(cursor, filename):
+	'''
+	Function to get the digest of a file as of its last incremental
+	load (None if it has not been loaded incrementally).
+	'''
+	cursor.execute("SELECT Digest FROM LoadedFile WHERE FileName = %s", (filename,))
+	loaded_file = cursor.fetchone()
+	return loaded_file[0] if loaded_file is not None else None
+
+def saveFileDigest(cursor, filename, digest):
+	'''
+	Function to record the digest of a file that has been loaded, and
+	commit it.
+	'''
+	cursor.execute("""INSERT INTO LoadedFile(FileName, Digest, LoadedAt) VALUES (%s, %s, now())
+					ON CONFLICT (FileName) DO UPDATE SET Digest = EXCLUDED.Digest, LoadedAt = EXCLUDED.LoadedAt""",
+					(filename, digest))
+	cursor.connection.commit()
+
+def loadChangedPartitions(cursor, csv_filename, load):
+	'''
+	Function for the incremental load of a relational CSV file. If the
+	file is unchanged since its last incremental load, it is skipped.
+	Otherwise the rows of every year that has changed (or is no longer
+	in the file) are deleted, and load(years) is called to load the new
+	and changed years. Returns True if the file had changed.
+	'''
+	file_digest = Database.fileDigest(csv_filename).hex()
+	if file_digest == getFileDigest(cursor, csv_filename):
+		print("Unchanged: ", csv_filename)
+		return False
+
+	digests = partitionDigests(csv_filename)
+	cursor.execute("SELECT Year, Digest FROM LoadedPartition WHERE FileName = %s", (csv_filename,))
+	loaded_digests = dict((year, digest) for year, digest in cursor.fetchall())
+	years = set(year for year, digest in digests.items() if loaded_digests.get(year) != digest)
+	removed_years = set(loaded_digests) - set(digests)
+
+	# The deletes are committed with the first checkpoint, so an interrupted
+	# load that is resuming has already made them
+	if getCheckpoint(cursor, csv_filename) == 0:
+		table, year_column = partitioned_tables[csv_filename]
+		cursor.execute("DELETE FROM {} WHERE {} = ANY(%s)".format(table, year_column), (list(years | removed_years),))
+	load(years)
+
+	cursor.execute("DELETE FROM LoadedPartition WHERE FileName = %s", (csv_filename,))
+	psycopg2.extras.execute_values(cursor, "INSERT INTO LoadedPartition(FileName, Year, Digest) VALUES %s",
+		[(csv_filename, year, digest) for year, digest in digests.items()])
+	saveFileDigest(cursor, csv_filename, file_digest)
+	return True
+
+def writeChangedDrugPoisoningXML(cursor):
+	'''
+	Function for the incremental load of the drug poisoning CSV file. The
+	XML file (and its snapshot) are only written again if the CSV file has
+	changed since its last incremental load, or if they are missing.
+	Returns True if they were written.
+	'''
+	file_digest = Database.fileDigest(drug_poisoning_file).hex()
+	if file_digest == getFileDigest(cursor, drug_poisoning_file) and os.path.exists(Database.xml_file) and os.path.exists(Database.snapshot_file):
+		print("Unchanged: ", drug_poisoning_file)
+		return False
+
+	writeDrugPoisoningXML()
+	saveFileDigest(cursor, drug_poisoning_file, file_digest)
+	return True
+
+
+# ***************** LOAD A DATASET *****************
+# The datasets, in the order they are loaded. Nutrition and CDI write
+# the shared lookup tables in this order in a parallel load too, so the
+# same rows win as in a serial load.
+datasets = ["Leading Causes of Death", "Nutrition", "Chronic Disease Indicators", "Drug Poisoning"]
+
+def loadDataset(cursor, dataset, incremental, bulk=False, dimension_cache=None, lookup_table_turn=None):
+	'''
+	Function to load one of the datasets with the row or bulk loaders.
+	If incremental is True, only a changed file is loaded (and for the
+	relational datasets, only its changed years). Returns True if
+	anything was loaded.
+	'''
+	if dataset == "Drug Poisoning":
+		if incremental:
+			return writeChangedDrugPoisoningXML(cursor)
+		writeDrugPoisoningXML()
+		return True
+
+	if dataset == "Leading Causes of Death":
+		csv_filename = leading_causes_of_death_file
+		load = lambda years: loadLeadingCausesOfDeath(cursor, dimension_cache or DimensionCache(cursor), years)
+	elif dataset == "Nutrition":
+		csv_filename = nutrition_file
+		if bulk:
+			load = lambda years: bulkLoadNutrition(cursor, lookup_table_turn, years)
+		else:
+			load = lambda years: loadNutrition(cursor, dimension_cache, years)
+	elif dataset == "Chronic Disease Indicators":
+		csv_filename = chronic_disease_indicators_file
+		if bulk:
+			load = lambda years: bulkLoadChronicDiseaseIndicators(cursor, lookup_table_turn, years)
+		else:
+			load = lambda years: loadChronicDiseaseIndicators(cursor, dimension_cache, years)
+
+	if incremental:
+		return loadChangedPartitions(cursor, csv_filename, load)
+	load(None)
+	return True
+
+
+# ***************** PARALLEL LOAD *****************
+# Connection string for the database (each parallel worker opens its own connection)
+connection_string = "host='localhost' dbname='dbms_final_project' user='dbms_project_user' password='dbms_password'"
+
+@contextlib.contextmanager
+def lookupTableTurn(conn, previous_turn_done, turn_done):
+	'''
+	Context manager for writing the shared lookup tables from a parallel
+	worker. It waits until the previous worker has committed its lookup
+	table rows (previous_turn_done), and commits this worker's rows before
+	signalling turn_done. Only one transaction writes the lookup tables at
+	a time, so the workers cannot deadlock on each other's uncommitted keys.
+	'''
+	if previous_turn_done is not None:
+		previous_turn_done.wait()
+	try:
+		yield
+		conn.commit()
+	finally:
+		turn_done.set()
+
+def loadDatasetWorker(dataset, previous_turn_done, turn_done, changes_loaded, rows_per_commit, incremental, use_columnar):
+	'''
+	Function run in its own process by the parallel loader, to load one
+	dataset on its own connection and commit it. Sets changes_loaded if
+	anything was loaded.
+	'''
+	global commit_every, columnar
+	commit_every = rows_per_commit
+	columnar = use_columnar
+	try:
+		conn = psycopg2.connect(connection_string)
+		cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+		# (only Nutrition and CDI share lookup tables, so the others need no turn)
+		lookup_table_turn = None
+		if dataset in ("Nutrition", "Chronic Disease Indicators"):
+			lookup_table_turn = lookupTableTurn(conn, previous_turn_done, turn_done)
+		if loadDataset(cursor, dataset, incremental, bulk=True, lookup_table_turn=lookup_table_turn):
+			changes_loaded.set()
+		conn.commit()
+		conn.close()
+	finally:
+		# Never leave the next worker waiting for a turn, even if this one failed
+		turn_done.set()
+
+def parallelLoad(incremental):
+	'''
+	Function to load every dataset at the same time, with one worker
+	process (and connection) per dataset. Returns True if anything was
+	loaded, and exits if a worker failed.
+	'''
+	workers = []
+	previous_turn_done = None
+	changes_loaded = multiprocessing.Event()
+	for dataset in datasets:
+		turn_done = multiprocessing.Event()
+		worker = multiprocessing.Process(target=loadDatasetWorker, name=dataset,
+			args=(dataset, previous_turn_done, turn_done, changes_loaded, commit_every, incremental, columnar))
+		worker.start()
+		workers.append(worker)
+		if dataset in ("Nutrition", "Chronic Disease Indicators"):
+			previous_turn_done = turn_done
+
+	succeeded = True
+	for worker in workers:
+		worker.join()
+		if worker.exitcode != 0:
+			print("Loading {} failed (exit code {})".format(worker.name, worker.exitcode))
+			succeeded = False
+	if not succeeded:
+		raise SystemExit(1)
+	return changes_loaded.is_set()
+
+
+# ***************** MAIN PROGRAM *****************
+if __name__ == "__main__":
+	arg_parser = argparse.ArgumentParser(description="Load the NCHS datasets into the database and the XML file.")
+	arg_parser.add_argument("--bulk", action="store_true",
+		help="load the Nutrition and CDI files with COPY into staging tables instead of one INSERT per row")
+	arg_parser.add_argument("--parallel", action="store_true",
+		help="load all of the datasets at the same time, one process per dataset (uses the --bulk loaders)")
+	arg_parser.add_argument("--commit-every", type=int, default=commit_every, metavar="ROWS",
+		help="number of rows loaded between commits and checkpoints (default: %(default)s)")
+	arg_parser.add_argument("--incremental", action="store_true",
+		help="skip the files that are unchanged since the last incremental load, and only load the changed years of the others")
+	arg_parser.add_argument("--columnar", action="store_true",
+		help="parse the drug poisoning CSV file a column at a time with pyarrow")
+	args = arg_parser.parse_args()
+	commit_every = args.commit_every
+	columnar = args.columnar
+
+	# ***************** General Set Up *****************
+	conn = psycopg2.connect(connection_string)
+	cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+
+	# ***************** Use the schema file to set up the database *****************
+	cursor.execute(open("schema.sql", "r").read())
+
+	# The loaders commit as they go (and the workers need the tables), so commit the schema first
+	conn.commit()
+
+	if args.parallel:
+		changes_loaded = parallelLoad(args.incremental)
+	else:
+		changes_loaded = False
+		dimension_cache = DimensionCache(cursor)
+		for dataset in datasets[:3]:
+			if loadDataset(cursor, dataset, args.incremental, args.bulk, dimension_cache):
+				changes_loaded = True
+
+	if changes_loaded:
+		refreshSummaryViews(cursor)
+
+		# ***************** POST-LOAD PHASE: INDEXES AND STATISTICS *****************
+		createIndexes(cursor)
+		printQueryPlanReport(cursor)
+
+		bumpDataVersion(cursor)
+	conn.commit()
+	clearCheckpoints(cursor)
+	# ***************** END OF RELATIONAL DATABASE *****************
+
+	# (the parallel load has already written the XML file)
+	if not args.parallel:
+		if loadDataset(cursor, "Drug Poisoning", args.incremental):
+			# Bump the version again so that the new XML file is picked up as well
+			bumpDataVersion(cursor)
+			conn.commit()
@@ -111,6 +111,64 @@ CREATE TABLE IF NOT EXISTS Nutrition(
 	FOREIGN KEY(QuestionID) REFERENCES QuestionInformation(QuestionID)
 );
 
+/**** Summary of the Nutrition Data ****/
+/* Sample size weighted percentage of each question for each location and year range, 
+   used by queries 2, 3 and 6 in Database.py. load_data.py refreshes it after every load. 
+   The weighted sum and sample size are kept as well, so that the percentage can be 
+   recomputed for groups of locations. */
+CREATE MATERIALIZED VIEW IF NOT EXISTS NutritionWeightedValue AS 
+	SELECT LocationID, YearStart, YearEnd, QuestionID, 
+		SUM(SampleSize * DataValue/100) AS WeightedSum, 
+		SUM(SampleSize) AS SampleSizeSum, 
+		ROUND(100*(SUM(SampleSize * DataValue/100) / SUM(SampleSize)),3) AS WeightedValue
+	FROM Nutrition
+	WHERE SampleSize > 0
+	GROUP BY (LocationID, YearStart, YearEnd, QuestionID);
+
+CREATE UNIQUE INDEX IF NOT EXISTS NutritionWeightedValueIndex ON NutritionWeightedValue(QuestionID, YearStart, YearEnd, LocationID);
+
+/**** Version of the loaded data ****/
+/* NOTE: load_data.py increments the version every time it commits a load, so that 
+   Database.py knows when its cached query results are out of date. */
+CREATE TABLE IF NOT EXISTS DataVersion(
+	Id BOOLEAN DEFAULT TRUE CHECK (Id), 
+	Version INT NOT NULL, 
+	LoadedAt TIMESTAMP, 
+	PRIMARY KEY(Id)
+);
+
+/**** Checkpoints of an unfinished load ****/
+/* NOTE: load_data.py records how many rows of each CSV file it has committed, 
+   so that an interrupted load can resume from there. The file size and modification 
+   time identify the file; a checkpoint for a different file is ignored. 
+   The checkpoints are deleted when a load finishes. */
+CREATE TABLE IF NOT EXISTS LoadCheckpoint(
+	FileName TEXT, 
+	FileSize BIGINT NOT NULL, 
+	FileModified BIGINT NOT NULL, 
+	RowNumber BIGINT NOT NULL, 
+	UpdatedAt TIMESTAMP, 
+	PRIMARY KEY(FileName)
+);
+
+/**** Digests of the incrementally loaded files ****/
+/* NOTE: load_data.py --incremental records the sha256 digest of every file it loads, 
+   and of the rows of each year (partition) of the relational CSV files. A later 
+   incremental load skips unchanged files, and only reloads the changed years. */
+CREATE TABLE IF NOT EXISTS LoadedFile(
+	FileName TEXT, 
+	Digest TEXT NOT NULL, 
+	LoadedAt TIMESTAMP, 
+	PRIMARY KEY(FileName)
+);
+
+CREATE TABLE IF NOT EXISTS LoadedPartition(
+	FileName TEXT, 
+	Year INT, 
+	Digest TEXT NOT NULL, 
+	PRIMARY KEY(FileName, Year)
+);
+
 /**** Tables for Drug Poisioning Mortality Data ****/
 /* NOTE: This table is no longer needed, as the data is in an XML file */
 -- CREATE TABLE DrugPoisioningMortality(
@@ -1,16 +1,156 @@
-import wget
-from os import mkdir
-from shutil import rmtree
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import tempfile
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 
-with open('code/datasets.txt') as datasets_file:
-    urls = datasets_file.readlines()
+# Number of files downloaded at the same time
+download_workers = 4
+
+# Size of the blocks read from the server (and written to the files)
+block_size = 1 << 20
+
+# Seconds to wait for the server before giving up on a file
+timeout = 60
+
+# Permissions of the downloaded files: what the umask allows, as for the files wget
+# creates (the temporary files they are downloaded to are only readable by the owner).
+# The umask can only be read by setting it, so it is read once, before any threads start.
+umask = os.umask(0)
+os.umask(umask)
+file_mode = 0o666 & ~umask
+
+
+def fileSha256(filename):
+    '''
+    Function to compute the sha256 digest of a file, as a hex string.
+    '''
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def readManifest(manifest_filename):
+    '''
+    Function to read the manifest written by the last run: a dictionary
+    of url: {filename, etag, last_modified, sha256} for each downloaded
+    file. Returns an empty dictionary if there is no manifest yet.
+    '''
+    try:
+        with open(manifest_filename) as manifest_file:
+            return json.load(manifest_file)
+    except (FileNotFoundError, ValueError):
+        return dict()
+
+def writeManifest(manifest_filename, manifest):
+    '''
+    Function to write the manifest to a temporary file and rename it
+    over the old one, so the manifest is never left half written.
+    '''
+    temp_filename = manifest_filename + '.part'
+    with open(temp_filename, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=4, sort_keys=True)
+    os.replace(temp_filename, manifest_filename)
+
+def downloadFile(url, output_dir, entry):
+    '''
+    Function to download one dataset into output_dir. entry is the
+    manifest entry of the url from the last run (or None). If the file
+    from the last run is still intact, the server is asked to only send
+    the file if it has changed (with its ETag and Last-Modified date).
+    The file is written to a temporary file, which is renamed over the
+    old file once it is complete. Returns the new manifest entry, and
+    "downloaded", "not modified" (by the server) or "unchanged" (the
+    same contents were downloaded again, so the old file is kept).
+    '''
+    request = urllib.request.Request(url, headers={'User-Agent': 'retrieve_data.py'})
+    old_file_intact = False
+    if entry is not None:
+        old_filename = os.path.join(output_dir, entry['filename'])
+        old_file_intact = os.path.exists(old_filename) and fileSha256(old_filename) == entry['sha256']
+        if old_file_intact:
+            if entry.get('etag'):
+                request.add_header('If-None-Match', entry['etag'])
+            if entry.get('last_modified'):
+                request.add_header('If-Modified-Since', entry['last_modified'])
+
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as error:
+        if error.code == 304:
+            return entry, "not modified"
+        raise
+
+    with response:
+        # Name the file the same way wget does: from the Content-Disposition header, or else the url
+        filename = response.headers.get_filename() or os.path.basename(urllib.parse.urlparse(url).path)
+        filename = os.path.basename(filename)
+        digest = hashlib.sha256()
+        temp_file = tempfile.NamedTemporaryFile(dir=output_dir, prefix=filename + '.', suffix='.part', delete=False)
+        try:
+            with temp_file:
+                for block in iter(lambda: response.read(block_size), b''):
+                    temp_file.write(block)
+                    digest.update(block)
+        except BaseException:
+            os.remove(temp_file.name)
+            raise
+
+    new_entry = {
+        'filename': filename,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'sha256': digest.hexdigest()
+    }
+
+    # Keep the old file (and its modification time) if the contents are the same
+    if old_file_intact and entry['filename'] == filename and entry['sha256'] == new_entry['sha256']:
+        os.remove(temp_file.name)
+        return new_entry, "unchanged"
+
+    os.chmod(temp_file.name, file_mode)
+    os.replace(temp_file.name, os.path.join(output_dir, filename))
+    return new_entry, "downloaded"
+
+
+# ***** MAIN PROGRAM *****
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Download the datasets listed in datasets.txt.")
+    arg_parser.add_argument("--datasets-file", default="code/datasets.txt",
+        help="file with one dataset url per line (default: %(default)s)")
+    arg_parser.add_argument("--output-dir", default="code/datasets",
+        help="folder to download the datasets into (default: %(default)s)")
+    arg_parser.add_argument("--workers", type=int, default=download_workers,
+        help="number of files to download at the same time (default: %(default)s)")
+    args = arg_parser.parse_args()
+
+    with open(args.datasets_file) as datasets_file:
+        urls = [line.strip() for line in datasets_file if line.strip()]
 
     if len(urls) > 5:
         raise Exception("Too many datasets were specified")
 
-    rmtree('code/datasets', ignore_errors=True)
-    mkdir('code/datasets')
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest_filename = os.path.join(args.output_dir, 'manifest.json')
+    manifest = readManifest(manifest_filename)
+
+    failed = False
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        downloads = [(url, executor.submit(downloadFile, url, args.output_dir, manifest.get(url))) for url in urls]
+        for url, download in downloads:
+            try:
+                manifest[url], status = download.result()
+                print(manifest[url]['filename'], status)
+            except (OSError, http.client.HTTPException) as error:
+                print("Could not download", url, ":", error)
+                failed = True
 
-    for u in urls:
-        f = wget.download(u.rstrip(), 'code/datasets/')
-        print(f)
\ No newline at end of file
+    writeManifest(manifest_filename, manifest)
+    if failed:
+        raise SystemExit(1)